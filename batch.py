@@ -0,0 +1,199 @@
+# batch.py - Solve many nonogram puzzle files on a worker pool, streaming JSON Lines
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+import dlxplus
+import nono
+import placecache
+import reader
+import solcache
+
+
+class PuzzleTimeout( Exception ):
+    pass
+
+
+def _alarm( signum, frame ):
+    raise PuzzleTimeout()
+
+
+def puzzle_files( paths, pattern="*.txt" ):
+    # Expand directories (files matching pattern) and glob patterns, in order
+    files = []
+    for path in paths:
+        if os.path.isdir( path ):
+            files += sorted( glob.glob( os.path.join( path, pattern ) ) )
+        elif glob.has_magic( path ):
+            files += sorted( glob.glob( path ) )
+        else:
+            files += [ path ]
+    return files
+
+
+def solve_file( fn_puzzle, timeout=None, max_solutions=None, profile=False, max_placements=None, solutions=None ):
+    """Solve one puzzle file and describe the outcome as a JSON-ready dict.
+
+    The search keeps the time limit itself; reading the puzzle and building
+    its matrix are cut short with SIGALRM, so this must run in the main
+    thread of its process (as pool workers do). With solutions, the path
+    of a solcache.SolutionCache file, puzzles solved before (maybe
+    transposed or mirrored) are looked up instead."""
+    return solve_spec( fn_puzzle, None, timeout, max_solutions, profile, max_placements, solutions )
+
+
+def solve_spec( name, spec, timeout=None, max_solutions=None, profile=False, max_placements=None, solutions=None ):
+    # solve_file for a puzzle already read, or read from the file name
+    # when spec is None. The time limit is a deadline the search checks
+    # between its steps; SIGALRM only cuts reading and building short, as
+    # an exception from it in the middle of a search step would leave the
+    # matrix and the interference half updated.
+    result = { "puzzle": name, "status": "error", "solutions": 0 }
+    start  = time.perf_counter()
+    deadline = start + timeout if timeout else None
+    statistics = dlxplus.dlx.DLXStatistics( profile=profile )
+    d = None
+    try:
+        if timeout:
+            # The caches hold the alarm back while they write (see
+            # placecache.alarm_blocked)
+            signal.signal( signal.SIGALRM, _alarm )
+            signal.setitimer( signal.ITIMER_REAL, timeout )
+        if None == spec:
+            spec = nono.nono_read( name )
+        result["rows"], result["cols"] = len(spec['rows']), len(spec['cols'])
+        result["placements"] = nono.nono_size( spec )
+        if None != max_placements and result["placements"] > max_placements:
+            result["status"] = "refused"
+        elif None != solutions:
+            cache = solcache.SolutionCache( solutions )
+            grids = cache.get( spec, max_solutions )
+            result["cached"] = None != grids
+            if None == grids:
+                d, found = nono.nono_solve( spec, max_solutions=max_solutions, statistics=statistics, deadline=deadline )
+                _search( timeout )
+                grids = nono.nono_cache_solutions( spec, cache, d, found, max_solutions )
+            result["solutions"] = len( grids )
+            if grids:
+                result["grid"] = nono.nono_grid_rows( grids[0] )
+            result["status"] = "solved" if grids else "unsolvable"
+        else:
+            d, found = nono.nono_solve( spec, max_solutions=max_solutions, statistics=statistics, deadline=deadline )
+            _search( timeout )
+            try:
+                for sol in found:
+                    if 0 == result["solutions"]:
+                        result["grid"] = nono.nono_solution_rows( spec, d, sol )
+                    result["solutions"] += 1
+            finally:
+                found.close()
+            result["status"] = "solved" if result["solutions"] else "unsolvable"
+        if statistics.limited:
+            result["status"] = "timeout"
+    except PuzzleTimeout:
+        result["status"] = "timeout"
+    except Exception as e:
+        result["error"] = "{}: {}".format( type(e).__name__, e )
+    finally:
+        if timeout:
+            signal.setitimer( signal.ITIMER_REAL, 0 )
+    result["seconds"] = round( time.perf_counter() - start, 6 )
+    if None != getattr( d, "statistics", None ):
+        result["nodes"], result["updates"] = sum( statistics.nodes ), sum( statistics.updates )
+        if profile:
+            result["statistics"] = nono.nono_statistics( d )
+    return result
+
+
+def _search( timeout ):
+    # The matrix is built: from here on the search keeps the deadline
+    if timeout:
+        signal.setitimer( signal.ITIMER_REAL, 0 )
+
+
+def _solve_task( task ):
+    return solve_file( *task )
+
+
+def solve_batch( files, jobs=None, timeout=None, max_solutions=None, cache=None, profile=False, max_placements=None,
+                 solutions=None ):
+    # Yield results in completion order. Workers keep their placement cache
+    # across puzzles and share it through the SQLite file cache if given.
+    tasks = [ (fn, timeout, max_solutions, profile, max_placements, solutions) for fn in files ]
+    with multiprocessing.Pool( jobs, initializer=nono.nono_set_cache, initargs=(placecache._PLACECACHE_MAXSIZE, cache) ) as pool:
+        for result in pool.imap_unordered( _solve_task, tasks ):
+            yield result
+
+
+def _failed( results, name ):
+    # Error callback for a task that failed outside of solve_spec, e.g. on
+    # pickling its result, which would otherwise never be answered
+    def _put( e ):
+        results.put( { "puzzle": name, "status": "error", "solutions": 0, "error": "{}: {}".format( type(e).__name__, e ) } )
+    return _put
+
+
+def solve_stream( paths, format=None, jobs=None, timeout=None, max_solutions=None, cache=None, profile=False,
+                  max_placements=None, solutions=None ):
+    # solve_batch over the puzzles of multi-puzzle files (see
+    # reader.read_puzzles), read as workers free up so that only a few
+    # puzzles per worker are held at a time. A file that does not parse
+    # gets an error result and the next file is read.
+    window  = 4 * ( jobs or os.cpu_count() or 1 )
+    results = queue.Queue()
+    pending = 0
+    with multiprocessing.Pool( jobs, initializer=nono.nono_set_cache, initargs=(placecache._PLACECACHE_MAXSIZE, cache) ) as pool:
+        for path in paths:
+            try:
+                for name, spec in reader.read_puzzles( path, format ):
+                    pool.apply_async( solve_spec, ( name, spec, timeout, max_solutions, profile, max_placements, solutions ),
+                                      callback=results.put, error_callback=_failed( results, name ) )
+                    pending += 1
+                    while pending >= window:
+                        yield results.get()
+                        pending -= 1
+            except ( OSError, reader.PuzzleParseError ) as e:
+                yield { "puzzle": path, "status": "error", "solutions": 0, "error": "{}: {}".format( type(e).__name__, e ) }
+        while pending:
+            yield results.get()
+            pending -= 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve nonogram puzzles in batch, one JSON line per puzzle.")
+    parser.add_argument("paths", nargs="+", help="Puzzle files, directories or glob patterns")
+    parser.add_argument("--pattern", default="*.txt", help="Puzzle files to take from directories")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--timeout", type=float, default=None, help="Time limit per puzzle in seconds")
+    parser.add_argument("--max-solutions", type=int, default=None, help="Stop counting solutions at this number")
+    parser.add_argument("--cache", default=None, help="SQLite file caching line placements across workers and runs")
+    parser.add_argument("--max-placements", type=int, default=None, help="Refuse puzzles with more line placements")
+    parser.add_argument("--solutions", default=None, help="SQLite file caching solutions across runs")
+    parser.add_argument("--profile", action="store_true", help="Add detailed search statistics to each result")
+    parser.add_argument("--stream", action="store_true", help="Read the puzzles out of multi-puzzle files as they are solved")
+    parser.add_argument("--format", choices=["lines", "non", "xml"], default=None,
+                        help="With --stream, format of all files (default: by extension)")
+    parser.add_argument("--output", default=None, help="JSON Lines file (default: stdout)")
+    args = parser.parse_args()
+    #
+    out = open( args.output, 'w' ) if args.output else sys.stdout
+    try:
+        files = puzzle_files( args.paths, args.pattern )
+        if args.stream:
+            results = solve_stream( files, args.format, args.jobs, args.timeout, args.max_solutions, args.cache,
+                                    args.profile, args.max_placements, args.solutions )
+        else:
+            results = solve_batch( files, args.jobs, args.timeout, args.max_solutions, args.cache, args.profile,
+                                   args.max_placements, args.solutions )
+        for result in results:
+            out.write( json.dumps( result ) + '\n' )
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
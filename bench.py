@@ -0,0 +1,205 @@
+# bench.py - Seeded nonogram corpora and solver benchmarks per size class
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+from statistics import median
+
+import batch
+import nono
+
+
+_BENCH_SIZES     = [ 5, 10, 15, 20, 30, 40, 50, 60 ]
+_BENCH_DENSITIES = [ 0.4, 0.6 ]
+_BENCH_COLORS    = [ 1, 3 ]
+
+
+def bench_grid( rnd, nrows, ncols, density, colors=1 ):
+    # Random grid of color codes. Multi-color grids only use letters: a black
+    # block needs a gap before the next block, which a random grid ignores.
+    if 1 == colors:
+        return [ [ 1 if rnd.random() < density else 0 for _ in range( ncols ) ] for _ in range( nrows ) ]
+    return [ [ rnd.randint( 2, colors + 1 ) if rnd.random() < density else 0 for _ in range( ncols ) ]
+             for _ in range( nrows ) ]
+
+
+def bench_clues( line ):
+    clues, prev, size = [], 0, 0
+    for code in list( line ) + [ 0 ]:
+        if code == prev:
+            size += 1
+            continue
+        if prev:
+            clues.append( "{}{}".format( size, "" if 1 == prev else chr( ord('a') + prev - 2 ) ) )
+        prev, size = code, 1
+    return nono._NONO_SPEC_SEPARATOR.join( clues ) if clues else "0"
+
+
+def bench_puzzle( grid ):
+    # Puzzle text in the nono_read format
+    rows = [ bench_clues( row ) for row in grid ]
+    cols = [ bench_clues( col ) for col in zip( *grid ) ]
+    return nono._NONO_LINE_SEPARATOR.join( rows ) + nono._NONO_DIMS_SEPARATOR + nono._NONO_LINE_SEPARATOR.join( cols )
+
+
+def bench_corpus( seed=0, sizes=_BENCH_SIZES, densities=_BENCH_DENSITIES, colors=_BENCH_COLORS, count=2 ):
+    # Yield (name, puzzle) pairs. Every puzzle gets its own generator seeded
+    # from its parameters, so a corpus is reproducible and growing one axis
+    # leaves the other puzzles unchanged.
+    for size in sizes:
+        for density in densities:
+            for ncolors in colors:
+                for i in range( count ):
+                    name = "s{:02d}_d{:02d}_c{}_{:03d}".format( size, round( 100*density ), ncolors, i )
+                    rnd  = random.Random( "{}:{}".format( seed, name ) )
+                    yield name, bench_puzzle( bench_grid( rnd, size, size, density, ncolors ) )
+
+
+def bench_generate( directory, seed=0, sizes=_BENCH_SIZES, densities=_BENCH_DENSITIES, colors=_BENCH_COLORS, count=2 ):
+    os.makedirs( directory, exist_ok=True )
+    files = []
+    for name, puzzle in bench_corpus( seed, sizes, densities, colors, count ):
+        fn = os.path.join( directory, name + ".txt" )
+        with open( fn, 'w' ) as file:
+            file.write( puzzle )
+        files.append( fn )
+    return files
+
+
+def bench_memory( fn_puzzle, timeout=None, max_solutions=None, max_placements=None ):
+    # Peak traced allocation of one solve, in bytes. Tracing slows the solver
+    # down, so this runs apart from the timed solve.
+    nono.nono_set_cache()
+    tracemalloc.start()
+    try:
+        batch.solve_file( fn_puzzle, timeout, max_solutions, False, max_placements )
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_run( files, timeout=10, max_solutions=2, max_placements=None, memory=True ):
+    """Solve the puzzles one after the other in this process, each with a
+    cold placement cache, and yield one result per puzzle."""
+    for fn in files:
+        nono.nono_set_cache()
+        result = batch.solve_file( fn, timeout, max_solutions, False, max_placements )
+        result.pop( "grid", None )
+        result["class"] = "{}x{}".format( result.get("rows", 0), result.get("cols", 0) )
+        if memory and result["status"] in ( "solved", "unsolvable" ):
+            result["memory"] = bench_memory( fn, timeout, max_solutions, max_placements )
+        yield result
+
+
+def bench_classes( results ):
+    # Summary per size class, in increasing size
+    groups = {}
+    for result in results:
+        groups.setdefault( result["class"], [] ).append( result )
+    classes = {}
+    for key in sorted( groups, key=lambda key: tuple( map( int, key.split("x") ) ) ):
+        group = groups[key]
+        done  = [ r for r in group if r["status"] in ( "solved", "unsolvable" ) ]
+        classes[key] = { "puzzles":   len( group ),
+                         "solved":    len( done ),
+                         "timeout":   sum( 1 for r in group if "timeout" == r["status"] ),
+                         "refused":   sum( 1 for r in group if "refused" == r["status"] ),
+                         "error":     sum( 1 for r in group if "error" == r["status"] ),
+                         "seconds":   round( sum( r["seconds"] for r in done ), 6 ),
+                         "median":    round( median( r["seconds"] for r in done ), 6 ) if done else None,
+                         "max":       round( max( r["seconds"] for r in done ), 6 ) if done else None,
+                         "nodes":     sum( r.get("nodes", 0) for r in done ),
+                         "memory":    max( ( r["memory"] for r in done if "memory" in r ), default=None ) }
+    return classes
+
+
+def bench_compare( classes, baseline, threshold=0.25, min_seconds=0.05 ):
+    """Compare size class summaries against a baseline. Returns a list of
+    (class, measure, baseline, current, regression) for every difference
+    worth a look; a regression is a ratio above 1 + threshold or a puzzle
+    no longer solved. Times below min_seconds are too noisy to compare."""
+    diffs = []
+    for key, current in classes.items():
+        base = baseline.get( key )
+        if None == base:
+            continue
+        if current["solved"] < base["solved"]:
+            diffs.append( (key, "solved", base["solved"], current["solved"], True) )
+            continue
+        for measure in ( "seconds", "nodes", "memory" ):
+            old, new = base.get( measure ), current.get( measure )
+            if not old or None == new:
+                continue
+            if "seconds" == measure and max( old, new ) < min_seconds:
+                continue
+            ratio = new / old
+            if ratio > 1 + threshold or ratio < 1 / (1 + threshold):
+                diffs.append( (key, measure, old, new, ratio > 1 + threshold) )
+    return diffs
+
+
+def bench_report( classes, out=sys.stdout ):
+    out.write( "{:>7} {:>7} {:>6} {:>7} {:>7} {:>10} {:>10} {:>10} {:>12} {:>10}\n".format(
+        "class", "puzzles", "solved", "timeout", "refused", "seconds", "median", "max", "nodes", "memory" ) )
+    for key, c in classes.items():
+        out.write( "{:>7} {:>7} {:>6} {:>7} {:>7} {:>10.3f} {:>10} {:>10} {:>12} {:>10}\n".format(
+            key, c["puzzles"], c["solved"], c["timeout"], c["refused"], c["seconds"],
+            "-" if None == c["median"] else "{:.3f}".format( c["median"] ),
+            "-" if None == c["max"] else "{:.3f}".format( c["max"] ),
+            c["nodes"], "-" if None == c["memory"] else "{}K".format( c["memory"] // 1024 ) ) )
+
+
+def _bench_list( str, type ):
+    return [ type( s ) for s in str.split(",") ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate seeded nonogram corpora and benchmark the solver on them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="Write a seeded corpus of random puzzles")
+    generate.add_argument("directory", help="Directory for the puzzle files")
+    generate.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    generate.add_argument("--sizes", default=",".join( map( str, _BENCH_SIZES ) ), help="Grid sizes (square)")
+    generate.add_argument("--densities", default=",".join( map( str, _BENCH_DENSITIES ) ), help="Filled cell ratios")
+    generate.add_argument("--colors", default=",".join( map( str, _BENCH_COLORS ) ), help="Numbers of colors (1 is black and white)")
+    generate.add_argument("--count", type=int, default=2, help="Puzzles per size, density and colors")
+    run = commands.add_parser("run", help="Solve puzzles and report per size class")
+    run.add_argument("paths", nargs="+", help="Puzzle files, directories or glob patterns")
+    run.add_argument("--pattern", default="*.txt", help="Puzzle files to take from directories")
+    run.add_argument("--timeout", type=float, default=10, help="Time limit per puzzle in seconds")
+    run.add_argument("--max-solutions", type=int, default=2, help="Stop counting solutions at this number")
+    run.add_argument("--max-placements", type=int, default=None, help="Refuse puzzles with more line placements")
+    run.add_argument("--no-memory", action="store_true", help="Skip the peak memory pass")
+    run.add_argument("--save", default=None, help="Write results and summaries to this JSON file")
+    run.add_argument("--baseline", default=None, help="Compare against results saved by --save")
+    run.add_argument("--threshold", type=float, default=0.25, help="Tolerated slowdown ratio over the baseline")
+    run.add_argument("--verbose", action="store_true", help="Print every result as it comes")
+    args = parser.parse_args()
+    #
+    if "generate" == args.command:
+        files = bench_generate( args.directory, args.seed, _bench_list( args.sizes, int ),
+                                _bench_list( args.densities, float ), _bench_list( args.colors, int ), args.count )
+        print( "{} puzzles written to {}".format( len( files ), args.directory ) )
+        sys.exit( 0 )
+    #
+    results = []
+    for result in bench_run( batch.puzzle_files( args.paths, args.pattern ), args.timeout,
+                             args.max_solutions, args.max_placements, not args.no_memory ):
+        if args.verbose:
+            print( json.dumps( result ), file=sys.stderr )
+        results.append( result )
+    classes = bench_classes( results )
+    bench_report( classes )
+    if args.save:
+        with open( args.save, 'w' ) as file:
+            json.dump( { "results": results, "classes": classes }, file, indent=1 )
+    if args.baseline:
+        with open( args.baseline, 'r' ) as file:
+            baseline = json.load( file )["classes"]
+        diffs = bench_compare( classes, baseline, args.threshold )
+        for key, measure, old, new, regression in diffs:
+            print( "{:>7} {:<8} {} -> {} {}".format( key, measure, old, new, "REGRESSION" if regression else "" ) )
+        if any( diff[4] for diff in diffs ):
+            sys.exit( 1 )
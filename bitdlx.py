@@ -0,0 +1,330 @@
+# bitdlx.py - Exact cover by Algorithm X over big-integer bitsets, behind the dlx.DLX API
+import copy
+import itertools
+
+import dlx
+
+
+class BitDLX(dlx.AlgorithmX):
+    """An exact cover problem solved with Algorithm X, keeping the active rows
+    as one big integer bitset and the rows of each column as another, so that
+    selecting a row removes all the rows it conflicts with in a few bulk
+    bitwise operations instead of one link update per node.
+
+    Columns, rows, row names, row identifiers, solve() and the column
+    selector contract are those of dlx.DLX, including colored secondary
+    columns: rows may give a secondary column a positive color with a
+    (column index, color) entry, and rows agreeing on it may then be part
+    of the same solution. Row identifiers index N like node indices do in
+    dlx.DLX; they are also the bit positions of the rows.
+
+    Column selectors receive the BitDLX; the provided ones have the names
+    of their dlx.DLX counterparts and make the same choices. Custom
+    selectors may use size(c), and the open primary columns as the bits of
+    self.open. The search, checkpoints and statistics are those of
+    dlx.AlgorithmX."""
+
+    def __init__(self, columns, rows=None, rowNames=None):
+        """Initialize the problem with the specified columns and row data, if
+        provided, as dlx.DLX does."""
+
+        self.header = len(columns)
+        self.N = [colname for (colname, _) in columns] + [None]
+        # For each column, the rows in it, and for a colored column the rows
+        # giving it each color.
+        self.colrows = [0] * self.header
+        self.colorrows = [{} for _ in columns]
+        # For each row (by identifier), its (column, color) entries and its
+        # primary columns as a bitset.
+        self.rowcols = [None] * (self.header + 1)
+        self.primaryOf = [0] * (self.header + 1)
+        self.primary = sum(1 << c for c, (_, columntype) in enumerate(columns) if columntype == self.PRIMARY)
+
+        # The search state: rows compatible with the partial solution, and
+        # primary columns left to cover.
+        self.active = 0
+        self.open = self.primary
+        self.partialsolution = []
+        self.used = []
+        self.searchState = None
+
+        if rows:
+            self.appendRows(rows, rowNames)
+
+
+    def appendRows(self, rows, rowNames=None):
+        """Append the rows to the matrix, as dlx.DLX.appendRows does; rows and
+        rowNames may be generators. Returns a list containing row
+        identifiers."""
+
+        if rowNames == None:
+            rowNames = itertools.repeat(None)
+        return [self.appendRow(row, rowName) for row, rowName in zip(rows, rowNames)]
+
+
+    def appendRow(self, row, rowName=None):
+        """Append a row given as a list of column indices, or of (column
+        index, color) pairs for colored secondary columns. Returns its row
+        identifier."""
+
+        r = len(self.N)
+        bit = 1 << r
+        entries = []
+        primary = 0
+        for index in row:
+            color = 0
+            if type(index) is tuple:
+                index, color = index
+                self.colorrows[index][color] = self.colorrows[index].get(color, 0) | bit
+            self.colrows[index] |= bit
+            if self.primary >> index & 1:
+                primary |= 1 << index
+            entries.append((index, color))
+        self.N.append(rowName)
+        self.rowcols.append(entries)
+        self.primaryOf.append(primary)
+        self.active |= bit
+        return r
+
+
+    def copy(self):
+        """Return an independent copy of the problem in its current state."""
+
+        other = copy.copy(self)
+        other.colrows = self.colrows[:]
+        other.colorrows = [dict(colors) for colors in self.colorrows]
+        other.N = list(self.N)
+        other.rowcols = self.rowcols[:]
+        other.primaryOf = self.primaryOf[:]
+        other.partialsolution = self.partialsolution[:]
+        other.used = self.used[:]
+        return other
+
+
+    def _conflicts(self, r):
+        """This is an internal function and should not be called directly.
+
+        The rows that cannot be part of a solution together with row r: those
+        sharing an uncolored column with it, or giving one of its colored
+        columns another color."""
+
+        removed = 1 << r
+        for c, color in self.rowcols[r]:
+            if color:
+                removed |= self.colrows[c] & ~self.colorrows[c][color]
+            else:
+                removed |= self.colrows[c]
+        return removed
+
+
+    def useRow(self, rowindex):
+        """Force the row into the partial solution, as dlx.DLX.useRow does.
+        Rows must be unused in reverse order. Returns False, leaving the
+        problem untouched, if the row is rejected by _selectRow."""
+
+        if not self._selectRow(rowindex):
+            return False
+        self.partialsolution.append(rowindex)
+        self._coverRow(rowindex)
+        return True
+
+
+    def unuseRow(self, rowindex):
+        assert(self.partialsolution.pop() == rowindex)
+        self._uncoverRow(rowindex)
+        self._unselectRow(rowindex)
+
+
+    def size(self, c):
+        """The number of active rows in column c."""
+
+        return (self.active & self.colrows[c]).bit_count()
+
+
+    # *** PROVIDED COLUMN SELECTORS ***
+    def leftmostColumnSelector(self, _):
+        """Select the leftmost open primary column."""
+
+        if self.open == 0:
+            return self.header
+        return (self.open & -self.open).bit_length() - 1
+
+
+    def smallestColumnSelector(self, _):
+        """Select the open primary column with the fewest active rows, the
+        leftmost one on ties."""
+
+        smallest, fewest = self.header, None
+        active, colrows = self.active, self.colrows
+        remaining = self.open
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            c = low.bit_length() - 1
+            count = (active & colrows[c]).bit_count()
+            if fewest == None or count < fewest:
+                smallest, fewest = c, count
+                if count == 0:
+                    break
+        return smallest
+
+
+    def randomColumnSelector(self, rnd):
+        """Select an open primary column with the fewest active rows, breaking
+        ties uniformly at random. The userdata must be a random.Random."""
+
+        smallest, fewest, ties = self.header, None, 0
+        active, colrows = self.active, self.colrows
+        remaining = self.open
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            c = low.bit_length() - 1
+            count = (active & colrows[c]).bit_count()
+            if fewest == None or count < fewest:
+                smallest, fewest, ties = c, count, 1
+            elif count == fewest:
+                ties += 1
+                if rnd.randrange(ties) == 0:
+                    smallest = c
+        return smallest
+
+
+    def getRowList(self, row):
+        """Get a list of the column names corresponding to the row."""
+
+        return [self.N[c] for c, _ in self.rowcols[row]]
+
+
+    # *** SEARCH PRIMITIVES, see dlx.AlgorithmX ***
+    def _complete(self):
+        """This is an internal function and should not be called directly."""
+
+        return self.open == 0
+
+
+    def _columnRows(self, c):
+        """This is an internal function and should not be called directly.
+
+        The active rows of column c, kept in its frame as those left to
+        try, or None if there are none."""
+
+        return self.active & self.colrows[c] or None
+
+
+    def _coverColumn(self, c):
+        """This is an internal function and should not be called directly.
+
+        Nothing to do: the rows of c are left with the frame, and those of
+        a row leave with its conflicts."""
+
+        return 0
+
+
+    def _uncoverColumn(self, c):
+        """This is an internal function and should not be called directly."""
+
+        pass
+
+
+    def _nextRow(self, frame, rejections):
+        """This is an internal function and should not be called directly.
+
+        The next row left in frame whose _selectRow accepts it, in the order
+        they were appended, -1 once the column is exhausted."""
+
+        candidates = frame[2]
+        while candidates:
+            low = candidates & -candidates
+            candidates ^= low
+            r = low.bit_length() - 1
+            if self._selectRow(r):
+                break
+            if rejections != None:
+                rejections[frame[0]] = rejections.get(frame[0], 0) + 1
+        else:
+            r = -1
+        frame[2] = candidates
+        return r
+
+
+    def _coverRow(self, r):
+        """This is an internal function and should not be called directly.
+
+        Removes the rows conflicting with row r and the primary columns it
+        covers, saving the state for _uncoverRow. The updates counted are
+        the rows removed."""
+
+        self.used.append((self.active, self.open))
+        removed = self.active & self._conflicts(r)
+        self.active ^= removed
+        self.open &= ~self.primaryOf[r]
+        return removed.bit_count()
+
+
+    def _uncoverRow(self, r):
+        """This is an internal function and should not be called directly."""
+
+        self.active, self.open = self.used.pop()
+
+
+    def _rowCovers(self, r):
+        """This is an internal function and should not be called directly.
+
+        The columns covered when row r joins the partial solution, besides
+        the column r was chosen in."""
+
+        return sum(1 for _, color in self.rowcols[r] if color == 0) - 1
+
+
+
+# Testing code.
+if __name__ == '__main__':
+    columns = [('a',BitDLX.PRIMARY), ('b',BitDLX.PRIMARY), ('c',BitDLX.PRIMARY), ('d',BitDLX.SECONDARY), ('e',BitDLX.PRIMARY)]
+    d = BitDLX(columns)
+    rows = [[1,2,4],
+            [0,1,3],
+            [0],
+            [0,1,2,3,4]]
+    rowNames = ['row%i' % i for i in range(len(rows))]
+    d.appendRows(rows, rowNames)
+    for sol in d.solve():
+        d.printSolution(sol)
+
+    # Self-check: rows from generators, with and without names, give the
+    # solutions dlx.DLX gives.
+    for names in [None, rowNames]:
+        solutions = []
+        for matrix in [dlx.DLX(columns), BitDLX(columns)]:
+            ids = matrix.appendRows((row for row in rows), None if names == None else (name for name in names))
+            assert len(ids) == len(rows)
+            solutions.append(sorted(sorted((matrix.N[r], sorted(matrix.getRowList(r))) for r in sol)
+                                    for sol in matrix.solve()))
+        assert solutions[0] == solutions[1] and len(solutions[0]) == 2, solutions
+
+    # Self-check: on the puzzles in the source tree, the bitsets find the
+    # solutions dancing links find, with the same search tree, also across
+    # a checkpoint and with profiling.
+    import os
+    import tempfile
+    import nono
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ['zazhim.txt', 'color5.txt']:
+        spec = nono.nono_read(os.path.join(here, name))
+        for presolve in [True, False]:
+            runs = []
+            for backend in ['links', 'bits']:
+                d, solutions = nono.nono_solve(spec, presolve=presolve, encoding='cells', backend=backend,
+                                               statistics=dlx.DLXStatistics(profile=True))
+                grids = sorted(str(nono.nono_solution_rows(spec, d, sol)) for sol in solutions)
+                runs.append((grids, d.statistics.nodes, sum(d.statistics.covers)))
+            assert runs[0] == runs[1], (name, presolve)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'checkpoint')
+                solutions = d.solve(checkpoint=path, checkpoint_interval=0)
+                next(solutions, None)
+                solutions.close()
+                # The solution yielded last was not consumed.
+                resumed = BitDLX.load(path).resume()
+                assert sorted(str(nono.nono_solution_rows(spec, d, sol)) for sol in resumed) == runs[1][0]
+            print(name, 'presolve' if presolve else 'no presolve', len(runs[1][0]), sum(runs[1][1]))
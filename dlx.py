@@ -23,16 +23,407 @@ By Sebastian Raaphorst, 2008.
 Thanks to the following people for their testing efforts:
    * Winfried Plappert"""
 
-
-class DLX:
-    """The DLX data structure and relevant operations."""
+import copy
+import itertools
+import json
+import os
+import pickle
+import time
+from array import array
+
+
+class AlgorithmX:
+    """The search for exact covers shared by the matrix representations, DLX
+    (dancing links) and bitdlx.BitDLX (bitsets): solving, checkpoints,
+    statistics and the row hooks.
+
+    A representation keeps header, N, partialsolution and searchState like
+    DLX does, and provides the primitives of the search, each internal:
+    _complete, _columnRows, _coverColumn, _uncoverColumn, _nextRow,
+    _coverRow, _uncoverRow and _rowCovers. Row identifiers must not be
+    negative, and whatever _columnRows keeps in the frames must pickle for
+    checkpoints."""
 
     # These pertain to column types.
     # Primary columns must be covered.
-    # Secondary columns can be covered at most once.
+    # Secondary columns can be covered at most once, or by any number of
+    # rows giving them the same color.
     PRIMARY = 0
     SECONDARY = 1
 
+    def save(self, path):
+        """Pickle the matrix, with its row names and any state kept by
+        subclasses, to the file at path. The file is replaced atomically, so
+        an interrupted save leaves the previous one intact."""
+
+        temp = path + '.tmp'
+        with open(temp, 'wb') as file:
+            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+
+
+    @staticmethod
+    def load(path):
+        """Load a matrix written by save, e.g. by a checkpoint, whatever its
+        class."""
+
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+    def printSolution(self, solution):
+        """A convenience function, which simply writes out each of the chosen
+        rows in the covering as a list of column names."""
+        for i in solution:
+            print(self.getRowList(i))
+
+
+    def solve(self,
+              columnselector=None,
+              columnselectoruserdata=None,
+              max_solutions=None,
+              statistics=None,
+              checkpoint=None,
+              checkpoint_interval=60,
+              max_nodes=None,
+              deadline=None):
+        """Solve the DLX problem.
+
+        The function accepts two parameters, as follows:
+
+        1. Function: columnselector(DLX, columnselectoruserdata)
+        The columnselector function, given the header, and the partial solution
+        (stored as a list of rows, with entries being the first DLXEntry in each
+        row), should choose a column to process next. If header is returned,
+        then it is assumed that no column can be selected and the problem
+        backtracks. Default value is None, i.e. smallestColumnSelector.
+
+        2. column selector userdata
+        Data to be passed to the supplied column selector as a second parameter.
+        Default value is None.
+
+        3. max_solutions
+        If given, the search stops after yielding this many solutions.
+        Default value is None, i.e. all solutions.
+
+        4. statistics
+        A DLXStatistics object to populate, e.g. one created with profiling
+        or callbacks enabled. Default value is None, i.e. a new plain one.
+
+        5. checkpoint, checkpoint_interval
+        If checkpoint is a file name, the matrix and the search position are
+        saved there (see save) every checkpoint_interval seconds, when the
+        search stops at max_solutions and when it completes. A checkpoint is
+        only taken once every solution found so far has been consumed, so
+        resuming it never yields them again. Default value is None.
+
+        6. max_nodes
+        If given, the search gives up after trying this many rows, setting
+        statistics.limited. Default value is None, i.e. no limit.
+
+        7. deadline
+        If given, a time.perf_counter() value past which the search gives
+        up, setting statistics.limited. It is checked before every step, so
+        unlike an exception raised from a signal handler it never leaves the
+        matrix or the row hooks halfway through an update. Default value is
+        None, i.e. no limit.
+
+        It yields solutions to the DLX instance, serving as a generator. Thus,
+        to process all solutions, one should execute:
+
+        for solution in DLXinstance.solve():
+           process solution here
+
+        Whenever the search stops early, by reaching max_solutions or because
+        the generator is closed, the matrix is restored by backing out of the
+        current search path only.
+
+        This call initializes and populated a DLXStatistics object, which may
+        be accessed as self.statistics."""
+
+        if columnselector == None:
+            columnselector = type(self).smallestColumnSelector
+        self.statistics = statistics if statistics != None else DLXStatistics()
+        self.searchState = None
+        yield from self._solve(columnselector, columnselectoruserdata, self.statistics,
+                               max_solutions=max_solutions, checkpoint=checkpoint,
+                               checkpoint_interval=checkpoint_interval, max_nodes=max_nodes,
+                               deadline=deadline)
+
+
+    def resume(self,
+               max_solutions=None,
+               checkpoint=None,
+               checkpoint_interval=60):
+        """Continue the search saved by a checkpoint, typically in a matrix
+        just returned by load, with the same column selector. Returns a
+        generator of the solutions not yielded before the checkpoint; the
+        statistics carry on in self.statistics.
+
+        max_solutions counts the solutions of this call only."""
+
+        if self.searchState == None:
+            raise ValueError("No search position to resume from")
+        state = self.searchState
+        elapsed = state['elapsed']
+        self.statistics.start = self.statistics.last = time.perf_counter() - elapsed
+        return self._solve(state['columnselector'], state['columnselectoruserdata'], self.statistics,
+                           max_solutions=max_solutions, checkpoint=checkpoint,
+                           checkpoint_interval=checkpoint_interval)
+
+
+    def is_unique(self,
+                  columnselector=None,
+                  columnselectoruserdata=None):
+        """Return True if the problem has exactly one solution. The search
+        stops as soon as a second solution is found."""
+
+        solutions = self.solve(columnselector, columnselectoruserdata, 2)
+        try:
+            return 1 == sum(1 for _ in solutions)
+        finally:
+            solutions.close()
+
+
+    def expand(self,
+               depth,
+               columnselector=None,
+               columnselectoruserdata=None):
+        """Run the search down to the given depth only, yielding the partial
+        solutions (lists of rows) reached there, as well as any complete
+        solution found above it. Every solution of the problem extends exactly
+        one of them, so forcing each one with useRow and solving gives
+        independent subproblems.
+
+        Like solve, this populates self.statistics for the levels above
+        depth."""
+
+        if columnselector == None:
+            columnselector = type(self).smallestColumnSelector
+        self.statistics = DLXStatistics()
+        yield from self._solve(columnselector, columnselectoruserdata, self.statistics, depth)
+
+
+    def _selectRow(self, r):
+        """Hook called before row r joins the partial solution. Returning False
+        skips the row. Subclasses may override this to reject rows or to keep
+        state alongside the matrix; every accepted row is later passed to
+        _unselectRow, in reverse order."""
+
+        return True
+
+
+    def _unselectRow(self, r):
+        """Hook called after row r left the partial solution."""
+
+        pass
+
+
+    def _exhaustRow(self, r, solution):
+        """Hook called when the search below row r is complete, just before r
+        leaves the partial solution; solution tells whether r completed a
+        solution (or reached maxdepth). Not called for the rows backed out of
+        when the search stops early."""
+
+        pass
+
+
+    def _solve(self, columnselector, columnselectoruserdata, statistics, maxdepth=None, max_solutions=None,
+               checkpoint=None, checkpoint_interval=None, max_nodes=None, deadline=None):
+        """This is an internal function and should not be called directly.
+
+        The search runs iteratively over an explicit stack holding one
+        [column, row, rows] frame per depth: the column covered at that
+        depth, the row of it currently in the partial solution (-1 before
+        its first row is tried) and what the representation keeps to find
+        the next one. Partial solutions reaching maxdepth are yielded without
+        being extended.
+
+        The search starts from self.searchState if set, i.e. from the stack
+        saved by a checkpoint and whether the top frame was to be extended
+        (descend) or moved on to its next row.
+
+        Profiling times and counts the covers and the row selection in
+        explicit branches, leaving the plain search as it is."""
+
+        stack = []
+        descend = True
+        if self.searchState != None:
+            stack, descend = self.searchState['stack'], self.searchState['descend']
+            self.searchState = None
+        found = 0
+        visited = 0
+        instrumented = statistics.instrumented()
+        rejections = statistics.rejections if instrumented else None
+        profiled = statistics.profile
+        clock = time.perf_counter
+        if checkpoint != None:
+            nextCheckpoint = clock() + checkpoint_interval
+        try:
+            while 1:
+                if checkpoint != None and clock() >= nextCheckpoint:
+                    self._checkpoint(checkpoint, stack, descend, columnselector, columnselectoruserdata)
+                    nextCheckpoint = clock() + checkpoint_interval
+                if deadline != None and clock() >= deadline:
+                    # Give up between steps, where the back out is safe.
+                    statistics.limited = True
+                    return
+
+                if descend:
+                    depth = len(stack)
+
+                    # Check to see if we have a complete solution.
+                    if self._complete() or depth == maxdepth:
+                        # Partial solutions at maxdepth are not solutions.
+                        if maxdepth == None:
+                            statistics.solutions.append(clock() - statistics.start)
+                        if instrumented:
+                            statistics.pause()
+                        # Make a copy so that it is preserved.
+                        yield self.partialsolution[:]
+                        if instrumented:
+                            statistics.resume()
+                        found += 1
+                        if found == max_solutions:
+                            if checkpoint != None:
+                                self._checkpoint(checkpoint, stack, False, columnselector, columnselectoruserdata)
+                            return
+                    else:
+                        # Make sure that the statistics are capable of holding the necessary information.
+                        if len(statistics.nodes) <= depth:
+                            statistics.nodes += [0] * (depth - len(statistics.nodes) + 1)
+                        if len(statistics.updates) <= depth:
+                            statistics.updates += [0] * (depth - len(statistics.updates) + 1)
+
+                        # Choose a column object, and cover it.
+                        c = columnselector(self, columnselectoruserdata)
+                        if c != self.header:
+                            rows = self._columnRows(c)
+                            if rows != None:
+                                if instrumented:
+                                    statistics.push(self.N[c])
+                                if profiled:
+                                    start = clock()
+                                statistics.updates[depth] += self._coverColumn(c)
+                                if profiled:
+                                    statistics.link_time += clock() - start
+                                    statistics.count('covers')
+                                stack.append([c, -1, rows])
+
+                # Backtrack, or move on to the next row at the deepest level.
+                if not stack:
+                    if checkpoint != None:
+                        self._checkpoint(checkpoint, stack, False, columnselector, columnselectoruserdata)
+                    return
+                frame = stack[-1]
+                r = frame[1]
+                if r >= 0:
+                    if instrumented:
+                        statistics.exit(len(stack)-1, r)
+                    self._exhaustRow(r, self._complete() or len(stack) == maxdepth)
+                    self._retractRow(r, statistics if profiled else None)
+                    frame[1] = -1
+
+                # Try the next row.
+                if profiled:
+                    start = clock()
+                r = self._nextRow(frame, rejections)
+                if profiled:
+                    statistics.select_time += clock() - start
+                if r < 0:
+                    # The column is exhausted.
+                    self._closeColumn(frame[0], statistics if profiled else None)
+                    stack.pop()
+                    if instrumented:
+                        statistics.pop()
+                    descend = False
+                    continue
+
+                if visited == max_nodes:
+                    # Give up, leaving the row unselected.
+                    self._unselectRow(r)
+                    frame[1] = -1
+                    statistics.limited = True
+                    return
+                visited += 1
+
+                frame[1] = r
+                self.partialsolution.append(r)
+                statistics.nodes[len(stack)-1] += 1
+                if instrumented:
+                    statistics.enter(len(stack)-1, r)
+
+                # Now cover the columns that are handled by the inclusion of
+                # this row.
+                if profiled:
+                    start = clock()
+                statistics.updates[len(stack)-1] += self._coverRow(r)
+                if profiled:
+                    statistics.link_time += clock() - start
+                    statistics.count('covers', self._rowCovers(r))
+                descend = True
+        finally:
+            # Back out of the current path if the search stopped early.
+            while stack:
+                c, r, _ = stack.pop()
+                if r >= 0:
+                    if instrumented:
+                        statistics.exit(len(stack), r)
+                    self._retractRow(r, statistics if profiled else None)
+                self._closeColumn(c, statistics if profiled else None)
+            if profiled:
+                statistics.pause()
+
+
+    def _retractRow(self, r, statistics=None):
+        """This is an internal function and should not be called directly.
+
+        Takes row r out of the partial solution, timed and counted in
+        statistics if given."""
+
+        self.partialsolution.pop()
+        if statistics == None:
+            self._uncoverRow(r)
+        else:
+            start = time.perf_counter()
+            self._uncoverRow(r)
+            statistics.link_time += time.perf_counter() - start
+            statistics.count('uncovers', self._rowCovers(r))
+        self._unselectRow(r)
+
+
+    def _closeColumn(self, c, statistics=None):
+        """This is an internal function and should not be called directly."""
+
+        if statistics == None:
+            self._uncoverColumn(c)
+        else:
+            start = time.perf_counter()
+            self._uncoverColumn(c)
+            statistics.link_time += time.perf_counter() - start
+            statistics.count('uncovers')
+
+
+    def _checkpoint(self, path, stack, descend, columnselector, columnselectoruserdata):
+        """This is an internal function and should not be called directly.
+
+        Saves the matrix in the middle of the search, along with what resume
+        needs to carry on."""
+
+        self.searchState = {'stack': stack,
+                            'descend': descend,
+                            'columnselector': columnselector,
+                            'columnselectoruserdata': columnselectoruserdata,
+                            'elapsed': time.perf_counter() - self.statistics.start}
+        try:
+            self.save(path)
+        finally:
+            self.searchState = None
+
+
+class DLX(AlgorithmX):
+    """The DLX data structure and relevant operations."""
+
     def __init__(self, columns, rows=None, rowNames=None):
         """Initialize the DLX problem with the specified columns and row data,
         if provided. Column data must be a list of pairs of the form
@@ -43,13 +434,20 @@ class DLX:
         # Create directional objects for the problem.
         # We need column headers equal to the number of columns, and one
         # more for the problem header.
+        # The links are kept in typed arrays of node indices, which are
+        # compact, grow in place and copy as a single block.
         self.nodect = len(columns)+1
-        self.U = [i for i in range(self.nodect)]
-        self.D = [i for i in range(self.nodect)]
-        self.L = [0] * self.nodect
-        self.R = list(range(self.nodect))
-        self.C = list(range(self.nodect))
-        self.S = [0] * self.nodect
+        self.U = array('i', range(self.nodect))
+        self.D = array('i', range(self.nodect))
+        self.L = array('i', bytes(self.nodect * 4))
+        self.R = array('i', range(self.nodect))
+        self.C = array('i', range(self.nodect))
+        self.S = array('i', bytes(self.nodect * 4))
+
+        # Node colors, for Algorithm C: 0 for uncolored nodes, a positive
+        # color, or -1 for nodes of a purified column agreeing with its color.
+        self.COLOR = array('i', bytes(self.nodect * 4))
+        self.colored = False
 
         # Remember to add one column name for the header; here we use None.
         self.N = [colname for (colname,_) in columns] + [None]
@@ -84,6 +482,9 @@ class DLX:
         # Store the solution variable.
         self.partialsolution = []
 
+        # The search position saved by the last checkpoint, if any.
+        self.searchState = None
+
         # If there are any rows, append them.
         if rows:
             self.appendRows(rows, rowNames)
@@ -92,16 +493,71 @@ class DLX:
     def appendRows(self, rows, rowNames=None):
         """Append the rows to the matrix. The row information should be provided
         as a list with each entry corresponding to a row, with row information
-        stored as a list of column indices where the 1s appear.
+        stored as a list of column indices where the 1s appear. An entry in a
+        secondary column may instead be a pair (column index, color) with a
+        positive color: rows agreeing on the color of a column can then be
+        part of the same solution (Knuth's Algorithm C).
+
+        When rows is a list (or any sized sequence), the storage for all of
+        its nodes is allocated up front and linked in a single pass. rows and
+        rowNames may also be generators; they are then consumed in lockstep,
+        appending row by row until either one is exhausted.
 
         Returns a list containing row identifiers, which are the indices of the
         first nodes appearing in the row."""
 
+        if hasattr(rows, '__len__') and (rowNames == None or hasattr(rowNames, '__len__')):
+            return self._appendRowsBulk(rows, rowNames)
+
         rowIdentifiers = []
+        if rowNames == None:
+            rowNames = itertools.repeat(None)
+        for row, rowName in zip(rows, rowNames):
+            rowIdentifiers.append(self.appendRow(row, rowName))
+        return rowIdentifiers
+
+
+    def _appendRowsBulk(self, rows, rowNames):
+        """This is an internal function and should not be called directly.
+
+        Links the rows exactly as successive calls to appendRow would."""
+
         if rowNames == None:
             rowNames = [None] * len(rows)
-        for i in range(len(rows)):
-            rowIdentifiers.append(self.appendRow(rows[i], rowNames[i]))
+        total = sum(len(row) for row in rows)
+
+        # Grow every array once.
+        zeros = array('i', bytes(total * 4))
+        for a in (self.U, self.D, self.L, self.R, self.C, self.COLOR):
+            a.extend(zeros)
+        U, D, L, R, C, S, COLOR = self.U, self.D, self.L, self.R, self.C, self.S, self.COLOR
+
+        rowIdentifiers = []
+        node = self.nodect
+        for row, rowName in zip(rows, rowNames):
+            first = node
+            rowIdentifiers.append(first)
+            # The row ring is first, then the other nodes in reverse order.
+            last = first + len(row) - 1
+            for index in row:
+                if type(index) is tuple:
+                    index, COLOR[node] = index
+                    self.colored = True
+                # Insert the node at the bottom of its column.
+                U[node] = U[index]
+                D[node] = index
+                D[U[index]] = node
+                U[index] = node
+                S[index] += 1
+                C[node] = index
+                L[node] = node + 1
+                R[node] = node - 1
+                node += 1
+            if len(row) > 0:
+                R[first] = last
+                L[last] = first
+            self.N.extend([rowName] * len(row))
+        self.nodect = node
         return rowIdentifiers
 
 
@@ -115,7 +571,12 @@ class DLX:
         first = self.nodect
         prev = self.nodect
         for index in row:
+            color = 0
+            if type(index) is tuple:
+                index, color = index
+                self.colored = True
             # Append data to all lists for the node representing this row.
+            self.COLOR.append(color)
             self.U.append(self.U[index])
             self.D.append(index)
             self.D[self.U[index]] = self.nodect
@@ -136,6 +597,19 @@ class DLX:
         return first
 
 
+    def copy(self):
+        """Return an independent copy of the matrix in its current state. The
+        link arrays are copied as whole blocks; row and column names are
+        shared."""
+
+        other = copy.copy(self)
+        for name in ('U', 'D', 'L', 'R', 'C', 'S', 'COLOR'):
+            setattr(other, name, array('i', getattr(self, name)))
+        other.N = list(self.N)
+        other.partialsolution = self.partialsolution[:]
+        return other
+
+
     def useRow(self, rowindex):
         """Given a row index, as returned by appendRows or appendRow, use this
         in the partial solution.
@@ -157,18 +631,28 @@ class DLX:
         executing the appropriate useRow calls prior to solving.
 
         This should NEVER be called during solving; failure to comply may result
-        in unpredictable behaviour."""
+        in unpredictable behaviour.
+
+        Returns False, leaving the matrix untouched, if the row is rejected by
+        _selectRow (as the search would reject it); True otherwise."""
+
+        if not self._selectRow(rowindex):
+            return False
 
         # Add the row to the solution.
         self.partialsolution.append(rowindex)
 
-        # Cover all columns in the row.
+        # Cover all columns in the row, or purify them if colored.
         i = rowindex
         while 1:
-            self._cover(self.C[i])
+            if self.COLOR[i] == 0:
+                self._cover(self.C[i])
+            elif self.COLOR[i] > 0:
+                self._purify(i)
             i = self.R[i]
             if i == rowindex:
                 break
+        return True
 
 
     def unuseRow(self, rowindex):
@@ -197,10 +681,14 @@ class DLX:
         # Uncover all columns in the row.
         i = self.L[rowindex]
         while 1:
-            self._uncover(self.C[i])
+            if self.COLOR[i] == 0:
+                self._uncover(self.C[i])
+            elif self.COLOR[i] > 0:
+                self._unpurify(i)
             i = self.L[i]
             if i == self.L[rowindex]:
                 break
+        self._unselectRow(rowindex)
 
 
     # *** PROVIDED COLUMN SELECTORS ***
@@ -227,6 +715,51 @@ class DLX:
         return smallest
 
 
+    def randomColumnSelector(self, rnd):
+        """Select a column with the fewest rows covering it, breaking ties
+        uniformly at random.
+
+        The userdata (second parameter) must be a random.Random."""
+
+        smallest = self.R[self.header]
+        ties = 1
+        j = self.R[smallest]
+        while j != self.header:
+            if self.S[j] < self.S[smallest]:
+                smallest, ties = j, 1
+            elif self.S[j] == self.S[smallest]:
+                ties += 1
+                if rnd.randrange(ties) == 0:
+                    smallest = j
+            j = self.R[j]
+        return smallest
+
+
+    def shuffleRows(self, rnd):
+        """Relink the rows of every column in random order, changing the order
+        in which the search tries them. The matrix must not be in use, i.e.
+        no row may be covered or used.
+
+        rnd is a random.Random."""
+
+        for c in range(self.header):
+            nodes = []
+            i = self.D[c]
+            while i != c:
+                nodes.append(i)
+                i = self.D[i]
+            if len(nodes) < 2:
+                continue
+            rnd.shuffle(nodes)
+            prev = c
+            for i in nodes:
+                self.D[prev] = i
+                self.U[i] = prev
+                prev = i
+            self.D[prev] = c
+            self.U[c] = prev
+
+
     def getRowList(self, row):
         """Get a list of the column names corresponding to the row."""
 
@@ -240,108 +773,99 @@ class DLX:
         return names
 
 
-    def printSolution(self, solution):
-        """A convenience function, which simply writes out each of the chosen
-        rows in the covering as a list of column names."""
-        for i in solution:
-            print(self.getRowList(i))
-
+    # *** SEARCH PRIMITIVES, see AlgorithmX ***
+    def _complete(self):
+        """This is an internal function and should not be called directly."""
 
-    def solve(self,
-              columnselector=smallestColumnSelector,
-              columnselectoruserdata=None):
-        """Solve the DLX problem.
+        return self.R[self.header] == self.header
 
-        The function accepts two parameters, as follows:
 
-        1. Function: columnselector(DLX, columnselectoruserdata)
-        The columnselector function, given the header, and the partial solution
-        (stored as a list of rows, with entries being the first DLXEntry in each
-        row), should choose a column to process next. If header is returned,
-        then it is assumed that no column can be selected and the problem
-        backtracks. Default value is smallestColumnSelector.
+    def _columnRows(self, c):
+        """This is an internal function and should not be called directly.
 
-        2. column selector userdata
-        Data to be passed to the supplied column selector as a second parameter.
-        Default value is None.
+        Where the search for rows of column c starts, kept in its frame as
+        the last node tried: the column header, or None if c has no rows."""
 
-        It yields solutions to the DLX instance, serving as a generator. Thus,
-        to process all solutions, one should execute:
+        return c if self.S[c] != 0 else None
 
-        for solution in DLXinstance.solve():
-           process solution here
 
-        This call initializes and populated a DLXStatistics object, which may
-        be accessed as self.statistics."""
+    def _coverColumn(self, c):
+        """This is an internal function and should not be called directly."""
 
-        self.statistics = DLXStatistics()
-        for sol in self._solve(0, columnselector, columnselectoruserdata, self.statistics):
-            yield sol
+        return self._cover(c)
 
 
-    def _solve(self, depth, columnselector, columnselectoruserdata, statistics):
+    def _uncoverColumn(self, c):
         """This is an internal function and should not be called directly."""
 
-        result = None
-
-        # Check to see if we have a complete solution.
-        if self.R[self.header] == self.header:
-            # Make a copy so that it is preserved.
-            yield self.partialsolution[:]
-            return
-
-        # Make sure that the statistics are capable of holding the necessary information.
-        if len(statistics.nodes) <= depth:
-            statistics.nodes += [0] * (depth - len(statistics.nodes) + 1)
-        if len(statistics.updates) <= depth:
-            statistics.updates += [0] * (depth - len(statistics.updates) + 1)
-
-        # Choose a column object.
-        c = columnselector(self, columnselectoruserdata)
-        if c == self.header or self.S[c] == 0:
-            return
-
-        # Cover the column.
-        statistics.updates[depth] += self._cover(c)
-
-        # Extend the solution by trying each possible row in the column.
-        r = self.D[c]
-        while r != c:
-            self.partialsolution.append(r)
-            statistics.nodes[depth] += 1
-
-            # Now cover the columns that are handled by the inclusion of this row.
-            j = self.R[r]
-            while j != r:
+        self._uncover(c)
+
+
+    def _nextRow(self, frame, rejections):
+        """This is an internal function and should not be called directly.
+
+        The next node down column frame[0] whose row _selectRow accepts, -1
+        once the column is exhausted."""
+
+        c = frame[0]
+        r = self.D[frame[2]]
+        while r != c and not self._selectRow(r):
+            if rejections != None:
+                rejections[c] = rejections.get(c, 0) + 1
+            r = self.D[r]
+        frame[2] = r
+        return r if r != c else -1
+
+
+    def _coverRow(self, r):
+        """This is an internal function and should not be called directly.
+
+        Covers the columns that are handled by the inclusion of row r, and
+        purifies the colored ones. The updates counted are those of the
+        chosen columns only, so none here."""
+
+        j = self.R[r]
+        while j != r:
+            if self.COLOR[j] == 0:
                 self._cover(self.C[j])
-                j = self.R[j]
+            elif self.COLOR[j] > 0:
+                self._purify(j)
+            j = self.R[j]
+        return 0
 
-            # Recursively search.
-            for sol in self._solve(depth+1, columnselector, columnselectoruserdata, statistics):
-                yield sol
 
-            # Reverse the operation.
-            self.partialsolution.pop()
+    def _uncoverRow(self, r):
+        """This is an internal function and should not be called directly."""
 
-            # We are no longer using this row right now, so uncover.
-            j = self.L[r]
-            while j != r:
+        # We are no longer using this row right now, so uncover.
+        j = self.L[r]
+        while j != r:
+            if self.COLOR[j] == 0:
                 self._uncover(self.C[j])
-                j = self.L[j]
+            elif self.COLOR[j] > 0:
+                self._unpurify(j)
+            j = self.L[j]
 
-            # If the result was not None, then terminate prematurely.
-            if result != None:
-                break
 
-            # Try the next row.
-            r = self.D[r]
+    def _rowCovers(self, r):
+        """This is an internal function and should not be called directly.
 
-        self._uncover(c)
-        return
+        The columns covered when row r joins the partial solution, besides
+        the column r was chosen in."""
+
+        count = 0
+        j = self.R[r]
+        while j != r:
+            if self.COLOR[j] == 0:
+                count += 1
+            j = self.R[j]
+        return count
 
 
     def _cover(self, c):
         """This is an internal function and should not be called directly."""
+        if self.colored:
+            return self._coverColored(c)
         updates = 1
 
         # Remove this column from the header.
@@ -368,6 +892,9 @@ class DLX:
     def _uncover(self, c):
         """This is an internal function and should not be called directly."""
 
+        if self.colored:
+            return self._uncoverColored(c)
+
         # Reverse the operations done in _cover.
         i = self.U[c]
         while i != c:
@@ -384,6 +911,93 @@ class DLX:
         self.L[self.R[c]] = c
 
 
+    def _coverColored(self, c):
+        """This is an internal function and should not be called directly.
+
+        _cover for matrices with colored nodes: nodes of purified columns
+        agreeing with their color (-1) stay linked."""
+
+        self.L[self.R[c]] = self.L[c]
+        self.R[self.L[c]] = self.R[c]
+        updates = 1
+        i = self.D[c]
+        while i != c:
+            updates += self._hide(i)
+            i = self.D[i]
+        return updates
+
+
+    def _uncoverColored(self, c):
+        """This is an internal function and should not be called directly."""
+
+        i = self.U[c]
+        while i != c:
+            self._unhide(i)
+            i = self.U[i]
+        self.R[self.L[c]] = c
+        self.L[self.R[c]] = c
+
+
+    def _hide(self, i):
+        """This is an internal function and should not be called directly.
+
+        Removes the row of node i from every column but that of i."""
+
+        updates = 0
+        j = self.R[i]
+        while j != i:
+            if self.COLOR[j] >= 0:
+                self.U[self.D[j]] = self.U[j]
+                self.D[self.U[j]] = self.D[j]
+                self.S[self.C[j]] -= 1
+                updates += 1
+            j = self.R[j]
+        return updates
+
+
+    def _unhide(self, i):
+        """This is an internal function and should not be called directly."""
+
+        j = self.L[i]
+        while j != i:
+            if self.COLOR[j] >= 0:
+                self.S[self.C[j]] += 1
+                self.D[self.U[j]] = j
+                self.U[self.D[j]] = j
+            j = self.L[j]
+
+
+    def _purify(self, p):
+        """This is an internal function and should not be called directly.
+
+        Commits the secondary column of node p to the color of p: rows giving
+        it another color are hidden, the others are marked as agreeing."""
+
+        color = self.COLOR[p]
+        c = self.C[p]
+        i = self.D[c]
+        while i != c:
+            if self.COLOR[i] != color:
+                self._hide(i)
+            elif i != p:
+                self.COLOR[i] = -1
+            i = self.D[i]
+
+
+    def _unpurify(self, p):
+        """This is an internal function and should not be called directly."""
+
+        color = self.COLOR[p]
+        c = self.C[p]
+        i = self.U[c]
+        while i != c:
+            if self.COLOR[i] < 0:
+                self.COLOR[i] = color
+            elif i != p:
+                self._unhide(i)
+            i = self.U[i]
+
+
 class DLXStatistics:
     """Statistics collected from a run of solving a DLX problem.
 
@@ -393,15 +1007,164 @@ class DLXStatistics:
     search tree.
 
     Updates represents the number of link updates performed at each
-    depth of the search tree."""
+    depth of the search tree.
+
+    Solutions holds the time elapsed, in seconds since start (when the
+    object was created, by default), when each solution was found; the
+    partial solutions yielded by expand are not counted.
 
-    def __init__(self):
-        """__init__(self)
+    Rejections maps column indices to the number of rows of that column
+    refused by _selectRow; for DLXplus, where each column is a line, the
+    rejections of each line by the interference. They are only counted
+    with profile or callbacks set, to keep plain searches fast.
+
+    Limited is set when the search gave up at its node limit.
+
+    With profile set, a search also records, per depth, the wall time spent
+    (time) and the calls to _cover and _uncover (covers, uncovers); the total
+    time spent in _selectRow (select_time) and in link updates (link_time);
+    and the time spent under each path of chosen columns (stacks), which
+    collapsed() exports for flame graphs.
+
+    on_enter(depth, row) and on_exit(depth, row), if given, are called when a
+    row joins and leaves the partial solution."""
+
+    def __init__(self, profile=False, on_enter=None, on_exit=None):
+        """__init__(self, profile=False, on_enter=None, on_exit=None)
 
         Create a new empty statistical object."""
 
         self.nodes = []
         self.updates = []
+        self.solutions = []
+        self.rejections = {}
+        self.limited = False
+
+        self.profile = profile
+        self.on_enter = on_enter
+        self.on_exit = on_exit
+        self.time = []
+        self.covers = []
+        self.uncovers = []
+        self.select_time = 0.
+        self.link_time = 0.
+        self.stacks = {}
+
+        # The path of column names being searched, and when time was last
+        # charged to it.
+        self.path = []
+        self.start = self.last = time.perf_counter()
+
+
+    def __getstate__(self):
+        # Callbacks need not be picklable; they stay with the caller.
+        state = self.__dict__.copy()
+        state['on_enter'] = state['on_exit'] = None
+        return state
+
+
+    def instrumented(self):
+        return self.profile or self.on_enter != None or self.on_exit != None
+
+
+    def _add(self, name, value):
+        counts = getattr(self, name)
+        depth = max(len(self.path) - 1, 0)
+        if len(counts) <= depth:
+            counts += [0] * (depth - len(counts) + 1)
+        counts[depth] += value
+
+
+    def count(self, name, n=1):
+        """Count n events of the given kind at the current depth."""
+
+        self._add(name, n)
+
+
+    def pause(self):
+        """Charge the time since the last event to the current path."""
+
+        if self.profile:
+            now = time.perf_counter()
+            elapsed = now - self.last
+            self._add('time', elapsed)
+            key = ';'.join(str(name) for name in self.path) or 'root'
+            self.stacks[key] = self.stacks.get(key, 0.) + elapsed
+            self.last = now
+
+
+    def resume(self):
+        """Restart the clock after time spent outside of the search."""
+
+        self.last = time.perf_counter()
+
+
+    def push(self, name):
+        self.pause()
+        self.path.append(name)
+
+
+    def pop(self):
+        self.pause()
+        self.path.pop()
+
+
+    def enter(self, depth, row):
+        if self.on_enter != None:
+            self.on_enter(depth, row)
+
+
+    def exit(self, depth, row):
+        if self.on_exit != None:
+            self.on_exit(depth, row)
+
+
+    def merge(self, other, offset=0):
+        """merge(self, other, offset=0)
+
+        Add the counts of other, collected on a subproblem rooted at the given
+        depth of this search, to this object."""
+
+        for name in ('nodes', 'updates', 'time', 'covers', 'uncovers'):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if len(mine) < len(theirs) + offset:
+                mine += [0] * (len(theirs) + offset - len(mine))
+            for depth, count in enumerate(theirs):
+                mine[depth + offset] += count
+        for name, count in other.rejections.items():
+            self.rejections[name] = self.rejections.get(name, 0) + count
+        for key, elapsed in other.stacks.items():
+            self.stacks[key] = self.stacks.get(key, 0.) + elapsed
+        self.solutions = sorted(self.solutions + other.solutions)
+        self.select_time += other.select_time
+        self.link_time += other.link_time
+
+
+    def as_dict(self):
+        """The statistics as a dictionary of plain values."""
+
+        return {"nodes": self.nodes,
+                "updates": self.updates,
+                "solutions": self.solutions,
+                "rejections": {str(name): count for name, count in self.rejections.items()},
+                "time": self.time,
+                "covers": self.covers,
+                "uncovers": self.uncovers,
+                "select_time": self.select_time,
+                "link_time": self.link_time}
+
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+
+    def collapsed(self):
+        """The time spent under each path of chosen columns, one
+        'name;name;... microseconds' line per path, as taken by flame graph
+        tools."""
+
+        return ''.join('%s %d\n' % (key, round(elapsed * 1e6))
+                       for key, elapsed in sorted(self.stacks.items()))
 
 
 # Testing code.
@@ -416,3 +1179,37 @@ if __name__ == '__main__':
     d.appendRows(rows, rowNames)
     for sol in d.solve():
         d.printSolution(sol)
+
+    # Self-check: every solution of the puzzles in the source tree is found
+    # by the iterative search, also when it is split at some depth, stopped
+    # early or checkpointed and resumed, and the matrix is left as it was.
+    import tempfile
+    import nono
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name, count in [('zazhim.txt', 1), ('color5.txt', 1)]:
+        spec = nono.nono_read(os.path.join(here, name))
+        for options in [dict(presolve=False, dynamic=False), dict(presolve=False, dynamic=False, encoding='cells')]:
+            d, solutions = nono.nono_solve(spec, **options)
+            found = sorted(sorted(sol) for sol in solutions)
+            nodes = sum(d.statistics.nodes)
+            assert len(found) == count, (name, options, len(found))
+            assert sorted(sorted(sol) for sol in d.solve()) == found
+            assert d.is_unique() == (count == 1)
+            assert len(list(d.solve(max_solutions=1))) == 1
+            split = []
+            for partial in list(d.expand(3)):
+                for r in partial:
+                    assert d.useRow(r)
+                split += [sorted(sol) for sol in d.solve()]
+                for r in reversed(partial):
+                    d.unuseRow(r)
+            assert sorted(split) == found
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'checkpoint')
+                solutions = d.solve(checkpoint=path, checkpoint_interval=0)
+                next(solutions, None)
+                solutions.close()
+                # The solution yielded last was not consumed.
+                resumed = AlgorithmX.load(path).resume()
+                assert sorted(sorted(sol) for sol in resumed) == found
+            print(name, options, len(found), nodes)
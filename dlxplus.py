@@ -22,19 +22,149 @@ By Sebastian Raaphorst, 2008.
 
 Thanks to the following people for their testing efforts:
    * Winfried Plappert"""
+from collections import OrderedDict
+
 import dlx
 import interference
 
+
+class NogoodTable:
+    """Hashes of the cell states (see Interference.select_hash) known to
+    lead to no solution, the maxsize most recently used of them. With
+    64-bit hashes, collisions are left to chance."""
+
+    def __init__(self, maxsize=1 << 20):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits, self.lookups, self.stores = 0, 0, 0
+
+
+    def __contains__(self, key):
+        self.lookups += 1
+        if key not in self.entries:
+            return False
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def add(self, key):
+        self.entries[key] = None
+        self.stores += 1
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+    def copy(self):
+        other = NogoodTable(self.maxsize)
+        other.entries = OrderedDict(self.entries)
+        return other
+
+
+    def as_dict(self):
+        return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits,
+                "lookups": self.lookups, "stores": self.stores,
+                "hit_rate": self.hits / self.lookups if self.lookups else None}
+
+
 class DLXplus( dlx.DLX ):
     """The DLXplus data structure and relevant operations."""
 
     interference = None
+    probing = None
+    nogoods = None
     
 
     def set_interference( self, interf ):
         self.interference = interf
 
 
+    def set_probing( self, depths ):
+        """Probe the cells of the puzzle (see Interference.probe) after the
+        rows selected at these search depths, the first row being at depth
+        0. Needs an interference tracking a line solver."""
+        self.probing = frozenset(depths) if depths else None
+
+
+    def set_nogoods(self, maxsize):
+        """Remember, in a NogoodTable of up to maxsize entries, the cell
+        states whose search found no solution, and reject the rows leading
+        back to one of them through another order of selection. Needs an
+        interference; a maxsize of 0 or None turns this off."""
+        self.nogoods = NogoodTable(maxsize) if maxsize else None
+        # [hash, solved] for each selected row, solved once a solution is
+        # known below it
+        self.nogoodPath = []
+
+
+    def copy(self):
+        """Return an independent copy of the matrix and of its interference."""
+
+        other = super().copy()
+        if None != self.interference:
+            other.interference = self.interference.copy()
+        if None != self.nogoods:
+            other.nogoods = self.nogoods.copy()
+            other.nogoodPath = [entry[:] for entry in self.nogoodPath]
+        return other
+
+
+    def interferenceColumnSelector(self, _):
+        """Select the line with the fewest placements compatible with the cells
+        fixed so far by the selected lines, as counted by the line solver
+        tracked in the interference (see Interference.track). Backtracks at
+        once if some line has no compatible placement left.
+
+        Falls back to smallestColumnSelector without a tracked line solver.
+        Note that the userdata (second parameter) is ignored."""
+
+        return self._interferenceColumn(None)
+
+
+    def randomInterferenceColumnSelector(self, rnd):
+        """interferenceColumnSelector breaking ties uniformly at random.
+
+        Falls back to randomColumnSelector without a tracked line solver.
+        The userdata (second parameter) must be a random.Random."""
+
+        return self._interferenceColumn(rnd)
+
+
+    def _interferenceColumn(self, rnd):
+        """This is an internal function and should not be called directly.
+
+        The choice of the interference column selectors: the first line with
+        the fewest placements, or with rnd a random one of them."""
+
+        if self.interference == None or self.interference.solver == None:
+            if rnd == None:
+                return self.smallestColumnSelector(None)
+            return self.randomColumnSelector(rnd)
+        alive = self.interference.solver.alive
+        smallest, fewest, ties = self.header, None, 0
+        j = self.R[self.header]
+        while j != self.header:
+            if self.S[j] == 0:
+                return self.header
+            # Every row in a column places the same line.
+            line = self.N[self.D[j]]
+            count = alive[line['entry_t']][line['entry']].bit_count()
+            if count == 0:
+                return self.header
+            if fewest == None or count < fewest:
+                smallest, fewest, ties = j, count, 1
+            elif count == fewest and rnd != None:
+                ties += 1
+                if rnd.randrange(ties) == 0:
+                    smallest = j
+            j = self.R[j]
+        return smallest
+
+
     def printSolution(self, solution):
         """A convenience function, which simply writes out each of the chosen
         rows in the covering as a list of column names."""
@@ -42,90 +172,61 @@ class DLXplus( dlx.DLX ):
             print(self.N[i], self.getRowList(i))
 
 
-    def _solve(self, depth, columnselector, columnselectoruserdata, statistics):
-        """This is an internal function and should not be called directly."""
-
-        result = None
-
-        # Check to see if we have a complete solution.
-        if self.R[self.header] == self.header:
-            # Make a copy so that it is preserved.
-            yield self.partialsolution[:]
-            return
-
-        # Make sure that the statistics are capable of holding the necessary information.
-        if len(statistics.nodes) <= depth:
-            statistics.nodes += [0] * (depth - len(statistics.nodes) + 1)
-        if len(statistics.updates) <= depth:
-            statistics.updates += [0] * (depth - len(statistics.updates) + 1)
-
-        # Choose a column object.
-        c = columnselector(self, columnselectoruserdata)
-        if c == self.header or self.S[c] == 0:
-            return
-
-        # Cover the column.
-        statistics.updates[depth] += self._cover(c)
-
-        # Extend the solution by trying each possible row in the column.
-        r = self.D[c]
-        while r != c:
-            # print( "Try row {}".format( self.N[r] ) )
-            # print( self.N[r]['entry_t'] )
-            if None != self.interference:
-                if 0 == self.N[r]['entry_t'] :
-                    selectable = self.interference.is_xselectable(self.N[r]['entry'], self.N[r]['compact'])
-                else:
-                    selectable = self.interference.is_yselectable(self.N[r]['entry'], self.N[r]['compact'])
-            else:
-                selectable = True
-            
-            if selectable:
-                if None != self.interference:
-                    if 0 == self.N[r]['entry_t']:
-                        self.interference.xselect(self.N[r]['entry'], self.N[r]['compact'])
-                    else:
-                        self.interference.yselect(self.N[r]['entry'], self.N[r]['compact'])
-                # Original processing
-                self.partialsolution.append(r)
-                statistics.nodes[depth] += 1
-
-                # Now cover the columns that are handled by the inclusion of this row.
-                j = self.R[r]
-                while j != r:
-                    self._cover(self.C[j])
-                    j = self.R[j]
-
-                # Recursively search.
-                for sol in self._solve(depth+1, columnselector, columnselectoruserdata, statistics):
-                    yield sol
-
-                # Reverse the operation.
-                self.partialsolution.pop()
+    def _selectRow(self, r):
+        """Accept row r only if its placement agrees with the cells fixed by
+        the selected crossing lines, and record it in the interference. When
+        the interference propagates, or the row is selected at a probing
+        depth, rows whose selection leaves some line without placements are
+        rejected too, and so are rows leading to a known nogood."""
 
-                # We are no longer using this row right now, so uncover.
-                j = self.L[r]
-                while j != r:
-                    self._uncover(self.C[j])
-                    j = self.L[j]
+        if None == self.interference:
+            return True
+        item = self.N[r]
+        if 0 == item['entry_t']:
+            if not self.interference.is_xselectable(item['entry'], item['masks'], item.get('rank')):
+                return False
+        else:
+            if not self.interference.is_yselectable(item['entry'], item['masks'], item.get('rank')):
+                return False
+        if None != self.nogoods:
+            key = self.interference.select_hash(item['entry_t'], item['entry'], item['masks'], item.get('rank'))
+            if key in self.nogoods:
+                return False
+        if 0 == item['entry_t']:
+            feasible = self.interference.xselect(item['entry'], item['masks'], item.get('rank'))
+        else:
+            feasible = self.interference.yselect(item['entry'], item['masks'], item.get('rank'))
+        if feasible and None != self.probing and len(self.interference.trail) - 1 in self.probing:
+            feasible = self.interference.probe()
+        if not feasible:
+            self.interference.unselect()
+        elif None != self.nogoods:
+            self.nogoodPath.append([key, False])
+        return feasible
 
-                if None != self.interference:
-                    if 0 == self.N[r]['entry_t']:
-                        self.interference.xunselect(self.N[r]['entry'])
-                    else:
-                        self.interference.yunselect(self.N[r]['entry'])
 
-                # print( "Retract row {}".format( self.N[r] ) );
+    def _unselectRow(self, r):
+        if None != self.interference:
+            if 0 == self.N[r]['entry_t']:
+                self.interference.xunselect(self.N[r]['entry'])
+            else:
+                self.interference.yunselect(self.N[r]['entry'])
+            if None != self.nogoods:
+                _, solved = self.nogoodPath.pop()
+                if solved and self.nogoodPath:
+                    self.nogoodPath[-1][1] = True
 
-            # If the result was not None, then terminate prematurely.
-            if result != None:
-                break
 
-            # Try the next row.
-            r = self.D[r]
+    def _exhaustRow(self, r, solution):
+        """Record the cell state reached with row r as a nogood if no
+        solution was found below it."""
 
-        self._uncover(c)
-        return
+        if None != self.interference and None != self.nogoods:
+            entry = self.nogoodPath[-1]
+            if solution:
+                entry[1] = True
+            elif not entry[1]:
+                self.nogoods.add(entry[0])
 
 
 
@@ -141,3 +242,25 @@ if __name__ == '__main__':
     d.appendRows(rows, rowNames)
     for sol in d.solve():
         d.printSolution(sol)
+
+    # Self-check: on the puzzles in the source tree, every option set of
+    # the lines encoding finds the same solutions, and nogoods only prune.
+    import os
+    import nono
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ['zazhim.txt', 'color5.txt']:
+        spec = nono.nono_read(os.path.join(here, name))
+        expected = None
+        for options in [dict(presolve=False, dynamic=False), dict(presolve=False), dict(), dict(propagate=True),
+                        dict(probe=[]), dict(probe=[1, 2]), dict(presolve=False, nogoods=1 << 16),
+                        dict(nogoods=64, propagate=True), dict(presolve=False, nogoods=1)]:
+            d, solutions = nono.nono_solve(spec, **options)
+            grids = sorted(str(nono.nono_solution_rows(spec, d, sol)) for sol in solutions)
+            if expected == None:
+                expected = grids
+            assert grids == expected, (name, options)
+            if 'nogoods' in options:
+                plain, solutions = nono.nono_solve(spec, **dict(options, nogoods=None))
+                list(solutions)
+                assert sum(d.statistics.nodes) <= sum(plain.statistics.nodes), (name, options)
+            print(name, options, len(grids), sum(d.statistics.nodes))
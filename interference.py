@@ -1,136 +1,290 @@
 # interference.py - Mixin for DLX to handle relationships between rows (in nonograms)
-import numpy as np
+import copy
+import random
+from array import array
+
+# Cell color of a line that is not selected
+UNKNOWN = -1
+
+
+def color_code( color ):
+    # 0 is white, 1 is black ("" in specs), 2+ are the lettered colors
+    if "" == color:
+        return 1
+    return 2 + ord( color[0].lower() ) - ord('a')
+
+
+def placement_masks( compact, n ):
+    # One integer per color code, bit i set when cell i has that color
+    masks = {}
+    for c in compact:
+        code = color_code( c['color'] )
+        masks[code] = masks.get( code, 0 ) | (1 << c['idx'])
+    white = ((1 << n) - 1) & ~sum( masks.values() )
+    if white:
+        masks[0] = white
+    return masks
+
+
+def _bits( mask ):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
 
 class Interference:
+    X, Y = 0, 1
+
     def __init__(self, nxs, nys ):
         self.nxs, self.nys = nxs, nys
-        self.state = [ {
-            "x_color":None,
-            "y_color":None,
-            "id": i,
-            "xid": i // nys,
-            "yid": i %  nys
-        } for i in range( nxs*nys ) ]
+        # Color code of each cell (row-major, id = xid*nys + yid) as set by
+        # the selected row (x_color) and column (y_color) placements.
+        self.x_color = array( 'b', [ UNKNOWN ] ) * (nxs*nys)
+        self.y_color = array( 'b', [ UNKNOWN ] ) * (nxs*nys)
+        self._blank  = array( 'b', [ UNKNOWN ] ) * nys
+        # Selected lines as (axis, id), most recent last
+        self.trail = []
+        # Masks of the placement selected on each line, None when unselected
+        self.xmasks = [ None ] * nxs
+        self.ymasks = [ None ] * nys
+        # For each row, the cells fixed by the selected columns and their
+        # colors as masks over yids; symmetrically for each column.
+        self.yknown  = [ 0 ] * nxs
+        self.ycolors = [ {} for _ in range( nxs ) ]
+        self.xknown  = [ 0 ] * nys
+        self.xcolors = [ {} for _ in range( nys ) ]
+        # Optional linesolver.LineSolver following the selections, with the
+        # solver's trail mark taken at each selection, and whether line
+        # solving runs to a fixpoint after each selection
+        self.solver = None
+        self.marks  = []
+        self.propagate = False
+        # Zobrist hash of the cell state, with the hash before each
+        # selection, the random keys of lines and of cells by color, and the
+        # key of every placement met so far
+        self.hash   = 0
+        self.hashes = []
+        self._random = random.Random( 0 )
+        self._line_keys = [ [ self._random.getrandbits( 64 ) for _ in range( nxs ) ],
+                            [ self._random.getrandbits( 64 ) for _ in range( nys ) ] ]
+        self._cell_keys = {}
+        self._keys  = {}
+
+
+    def copy( self ):
+        other = copy.copy( self )
+        other.x_color = array( 'b', self.x_color )
+        other.y_color = array( 'b', self.y_color )
+        other.trail   = self.trail[:]
+        other.xmasks, other.ymasks = self.xmasks[:], self.ymasks[:]
+        other.yknown, other.xknown = self.yknown[:], self.xknown[:]
+        other.ycolors = [ dict( c ) for c in self.ycolors ]
+        other.xcolors = [ dict( c ) for c in self.xcolors ]
+        other.marks   = self.marks[:]
+        other.hashes  = self.hashes[:]
+        if None != self.solver:
+            other.solver = self.solver.copy()
+        return other
+
+
+    def track( self, solver, propagate=False ):
+        # Keep the solver restricted to the placements compatible with the
+        # cells of the selected lines. Placements are then checked by rank.
+        # With propagate, the crossing lines losing placements are line
+        # solved to a fixpoint, so that cells they fix prune further lines.
+        self.solver = solver
+        self.propagate = propagate
 
 
     def __str__( self ):
         str = ""
         for xid in range( self.nxs ):
-            for val in self.get_x( xid ):
-                if val['x_color'] == None and val['y_color'] == None:
+            for x_color, y_color in zip( *self.get_x( xid ) ):
+                if x_color == UNKNOWN and y_color == UNKNOWN:
                     str += "."
                 else:
-                    if val['x_color'] == None or val['y_color'] == None:
-                        str += f"{val['x_color']}" if None == val['y_color'] else f"{val['y_color']}"
+                    if x_color == UNKNOWN or y_color == UNKNOWN:
+                        str += f"{x_color}" if UNKNOWN == y_color else f"{y_color}"
                     else:
-                        if val['x_color'] != val['y_color']:
+                        if x_color != y_color:
                             str += "X"
                         else:
-                            str += f"{val['x_color']}"
+                            str += f"{x_color}"
             str += '\n'
         return str
-        
+
 
     def get_x( self, xid ):
-        return self.state[ xid*self.nys:xid*self.nys+self.nys ]
+        # Views (no copy) on the x and y colors of the cells of row xid
+        start = xid*self.nys
+        return memoryview( self.x_color )[ start:start+self.nys ], \
+               memoryview( self.y_color )[ start:start+self.nys ]
 
 
     def get_y( self, yid ):
-        return [ self.state[x] for x in range( yid, self.nxs*self.nys, self.nys ) ]
+        return memoryview( self.x_color )[ yid::self.nys ], \
+               memoryview( self.y_color )[ yid::self.nys ]
 
 
-    def get_color( self, val, id , compact ):
-        compact_color = 0
-        id_a          = ord('a')
-        for c in compact:
-            if c['idx'] == val[id]:
-                if "" == c['color']:
-                    compact_color = 1
-                else:
-                    ch = c['color'][0].lower()
-                    compact_color = 2 + ord(ch) - id_a
-                break
-        return compact_color
+    def _is_selectable( self, masks, known, colors ):
+        if 0 == known:
+            return True
+        for code, m in masks.items():
+            if m & known != colors.get( code, 0 ):
+                return False
+        return True
 
 
-    def is_xselectable( self, xid, compact ):
-        for val in self.get_x( xid ):
-            if( None != val["x_color"] ):
-                return False
-            #
-            # compact_color = 1 if val["yid"] in compact else 0
-            compact_color = self.get_color( val, "yid", compact )
-            if None != val["y_color"] and compact_color != val["y_color"]:
-                return False
+    def _fix( self, lid, masks, known, colors ):
+        bit = 1 << lid
+        for code, m in masks.items():
+            for pos in _bits( m ):
+                known[pos] |= bit
+                colors[pos][code] = colors[pos].get( code, 0 ) | bit
+
+
+    def _unfix( self, lid, masks, known, colors ):
+        bit = 1 << lid
+        for code, m in masks.items():
+            for pos in _bits( m ):
+                known[pos] ^= bit
+                colors[pos][code] ^= bit
+
+
+    def _restrict( self, axis, lid, masks ):
+        # False if propagation finds a line without placements
+        self.marks.append( self.solver.mark() )
+        changed = []
+        for code, m in masks.items():
+            for pos in _bits( m ):
+                if self.solver.restrict( axis, pos, lid, code ):
+                    changed.append( (axis, pos) )
+        if self.propagate:
+            return self.solver.propagate( changed )
         return True
 
 
-    def xselect( self, xid, compact ):
-        for val in self.get_x( xid ):
-            # compact_color = 1 if val["yid"] in compact else 0
-            compact_color = self.get_color( val, "yid", compact )
-            self.state[ val["id"] ] = {
-                "x_color": compact_color,
-                "y_color": val["y_color"],
-                "id":      val["id"],
-                "xid":     val["xid"],
-                "yid":     val["yid"]
-                }
-            
+    def placement_key( self, axis, lid, masks, rank=None ):
+        # The key of the line and those of its cells in their colors. A cell
+        # fixed by both its lines cancels out of the hash, which no longer
+        # depends on it: its color can't affect the rest of the search.
+        # Placements are cached by rank, or by their masks without one.
+        placement = ( axis, lid, rank if None != rank else tuple( sorted( masks.items() ) ) )
+        key = self._keys.get( placement )
+        if None == key:
+            key = self._line_keys[axis][lid]
+            for code, m in masks.items():
+                for pos in _bits( m ):
+                    id = lid*self.nys + pos if self.X == axis else pos*self.nys + lid
+                    cell = self._cell_keys.get( (id, code) )
+                    if None == cell:
+                        cell = self._cell_keys[ (id, code) ] = self._random.getrandbits( 64 )
+                    key ^= cell
+            self._keys[placement] = key
+        return key
+
+
+    def select_hash( self, axis, lid, masks, rank=None ):
+        # The hash once the placement is selected. States with the same
+        # selected lines and the same cells fixed on the lines left hash the
+        # same, whatever the placements and the order of selection.
+        return self.hash ^ self.placement_key( axis, lid, masks, rank )
+
+
+    def probe( self ):
+        # Failed literal probing on the tracked solver, False on a
+        # contradiction. Its changes are undone with the latest selection.
+        return self.solver.probe()
+
+
+    def is_xselectable( self, xid, masks, rank=None ):
+        if None != self.xmasks[xid]:
+            return False
+        if None != self.solver and None != rank:
+            return 1 == self.solver.alive[self.X][xid] >> rank & 1
+        return self._is_selectable( masks, self.yknown[xid], self.ycolors[xid] )
+
+
+    def xselect( self, xid, masks, rank=None ):
+        # Returns False when propagation shows the selection is a dead end;
+        # the row must then still be unselected
+        self.trail.append( (self.X, xid) )
+        self.hashes.append( self.hash )
+        self.hash ^= self.placement_key( self.X, xid, masks, rank )
+        self.xmasks[xid] = masks
+        self._fix( xid, masks, self.xknown, self.xcolors )
+        feasible = True
+        if None != self.solver:
+            feasible = self._restrict( self.Y, xid, masks )
+        start = xid*self.nys
+        for code, m in masks.items():
+            for yid in _bits( m ):
+                self.x_color[ start + yid ] = code
+        return feasible
+
 
     def xunselect( self, xid ):
-        for val in self.get_x( xid ):
-            self.state[ val["id"] ] = {
-                "x_color": None,
-                "y_color": val["y_color"],
-                "id":      val["id"],
-                "xid":     val["xid"],
-                "yid":     val["yid"]
-                }
-
-
-    def is_yselectable( self, yid, compact ):
-        for val in self.get_y( yid ):
-            if( None != val["y_color"] ):
-                return False
-            #
-            # compact_color = 1 if val["xid"] in compact else 0
-            compact_color = self.get_color( val, "xid", compact )
-            if None != val["x_color"] and compact_color != val["x_color"]:
-                return False
-        return True
+        # Lines must be unselected in reverse order of selection
+        assert( self.trail.pop() == (self.X, xid) )
+        self.hash = self.hashes.pop()
+        self._unfix( xid, self.xmasks[xid], self.xknown, self.xcolors )
+        if None != self.solver:
+            self.solver.undo( self.marks.pop() )
+        self.xmasks[xid] = None
+        start = xid*self.nys
+        self.x_color[ start:start+self.nys ] = self._blank
 
 
-    def yselect( self, yid, compact ):
-        for val in self.get_y( yid ):
-            # compact_color = 1 if val["xid"] in compact else 0
-            compact_color = self.get_color( val, "xid", compact )
-            self.state[ val["id"] ] = {
-                "x_color": val["x_color"],
-                "y_color": compact_color,
-                "id":      val["id"],
-                "xid":     val["xid"],
-                "yid":     val["yid"]
-                }
+    def is_yselectable( self, yid, masks, rank=None ):
+        if None != self.ymasks[yid]:
+            return False
+        if None != self.solver and None != rank:
+            return 1 == self.solver.alive[self.Y][yid] >> rank & 1
+        return self._is_selectable( masks, self.xknown[yid], self.xcolors[yid] )
+
+
+    def yselect( self, yid, masks, rank=None ):
+        self.trail.append( (self.Y, yid) )
+        self.hashes.append( self.hash )
+        self.hash ^= self.placement_key( self.Y, yid, masks, rank )
+        self.ymasks[yid] = masks
+        self._fix( yid, masks, self.yknown, self.ycolors )
+        feasible = True
+        if None != self.solver:
+            feasible = self._restrict( self.X, yid, masks )
+        for code, m in masks.items():
+            for xid in _bits( m ):
+                self.y_color[ xid*self.nys + yid ] = code
+        return feasible
 
 
     def yunselect( self, yid ):
-        for val in self.get_y( yid ):
-            self.state[ val["id"] ] = {
-                "x_color": val["x_color"],
-                "y_color": None,
-                "id":      val["id"],
-                "xid":     val["xid"],
-                "yid":     val["yid"]
-                }
+        assert( self.trail.pop() == (self.Y, yid) )
+        self.hash = self.hashes.pop()
+        self._unfix( yid, self.ymasks[yid], self.yknown, self.ycolors )
+        if None != self.solver:
+            self.solver.undo( self.marks.pop() )
+        self.ymasks[yid] = None
+        for id in range( yid, self.nxs*self.nys, self.nys ):
+            self.y_color[ id ] = UNKNOWN
+
+
+    def unselect( self ):
+        # Undo the most recent selection
+        axis, lid = self.trail[-1]
+        if self.X == axis:
+            self.xunselect( lid )
+        else:
+            self.yunselect( lid )
 
 
 if __name__ == '__main__':
     a = Interference( 5, 5 )
-    c = [ {"idx":1, "color":"a"}, {"idx":2, "color":"a"} ]
+    c = placement_masks( [ {"idx":1, "color":"a"}, {"idx":2, "color":"a"} ], 5 )
     print( a.is_xselectable(1,c) )
     a.xselect( 1, c )
-    r = [{"idx":0, "color":"a"}, {"idx":1, "color":"a"}]
+    r = placement_masks( [{"idx":0, "color":"a"}, {"idx":1, "color":"a"}], 5 )
     print( a.is_yselectable(0,r) )
     print( a.is_yselectable(1,r) )
     a.yselect(1,r)
@@ -0,0 +1,185 @@
+# linesolver.py - Iterated line solving over enumerated placements (in nonograms)
+import copy
+from collections import deque
+
+import interference
+
+
+class LineSolver:
+    """Line solving by intersection of placements.
+
+    Each line (row or column) keeps the set of its placements still compatible
+    with the cells known so far as an integer bitset `alive`, bit i standing
+    for placement i. For every cell and color, `bits` holds the set of
+    placements painting that cell with that color, so restricting a line to a
+    known cell is a single AND. Changes are recorded on a trail and can be
+    undone back to a mark."""
+
+    X, Y = 0, 1
+
+    def __init__( self, xplacements, yplacements ):
+        self.nxs, self.nys = len(xplacements), len(yplacements)
+        self.placements = [ xplacements, yplacements ]
+        self.bits  = [ [ self._line_bits( p, self.nys ) for p in xplacements ],
+                       [ self._line_bits( p, self.nxs ) for p in yplacements ] ]
+        self.alive = [ [ (1 << len(p)) - 1 for p in xplacements ],
+                       [ (1 << len(p)) - 1 for p in yplacements ] ]
+        self.trail = []
+
+
+    def __str__( self ):
+        str = ""
+        for row in self.grid():
+            str += "".join( "." if None == code else f"{code}" for code in row ) + '\n'
+        return str
+
+
+    def copy( self ):
+        # Placements and their bits are never modified, so they are shared
+        other = copy.copy( self )
+        other.alive = [ self.alive[self.X][:], self.alive[self.Y][:] ]
+        other.trail = self.trail[:]
+        return other
+
+
+    @staticmethod
+    def _line_bits( placements, n ):
+        bits = [ {} for _ in range( n ) ]
+        for i, compact in enumerate( placements ):
+            codes = [ 0 ] * n
+            for c in compact:
+                codes[ c['idx'] ] = interference.color_code( c['color'] )
+            for pos, code in enumerate( codes ):
+                bits[pos][code] = bits[pos].get( code, 0 ) | (1 << i)
+        return bits
+
+
+    def mark( self ):
+        return len( self.trail )
+
+
+    def undo( self, mark ):
+        while len( self.trail ) > mark:
+            axis, lid, alive = self.trail.pop()
+            self.alive[axis][lid] = alive
+
+
+    def restrict( self, axis, lid, pos, code ):
+        """Keep only the placements of line (axis, lid) painting `pos` with
+        `code`. Returns True if the line lost placements."""
+        alive = self.alive[axis][lid]
+        new   = alive & self.bits[axis][lid][pos].get( code, 0 )
+        if new == alive:
+            return False
+        self.trail.append( (axis, lid, alive) )
+        self.alive[axis][lid] = new
+        return True
+
+
+    def exclude( self, axis, lid, pos, code ):
+        """Drop the placements of line (axis, lid) painting `pos` with
+        `code`. Returns True if the line lost placements."""
+        alive = self.alive[axis][lid]
+        new   = alive & ~self.bits[axis][lid][pos].get( code, 0 )
+        if new == alive:
+            return False
+        self.trail.append( (axis, lid, alive) )
+        self.alive[axis][lid] = new
+        return True
+
+
+    def line_cells( self, axis, lid ):
+        """Color code of every cell of the line common to all its remaining
+        placements, None where they disagree."""
+        alive = self.alive[axis][lid]
+        cells = []
+        for d in self.bits[axis][lid]:
+            fixed = None
+            for code, b in d.items():
+                if alive & b == alive:
+                    fixed = code
+                    break
+            cells.append( fixed )
+        return cells
+
+
+    def propagate( self, lines=None ):
+        """Run line solving to a fixpoint, starting from `lines` (all lines by
+        default). Returns False as soon as a line has no placement left."""
+        if None == lines:
+            lines = [ (self.X, xid) for xid in range( self.nxs ) ] + \
+                    [ (self.Y, yid) for yid in range( self.nys ) ]
+        pending = deque( lines )
+        queued  = set( lines )
+        while pending:
+            line = pending.popleft()
+            queued.discard( line )
+            axis, lid = line
+            if 0 == self.alive[axis][lid]:
+                return False
+            other = 1 - axis
+            for pos, code in enumerate( self.line_cells( axis, lid ) ):
+                if None != code and self.restrict( other, pos, lid, code ):
+                    if 0 == self.alive[other][pos]:
+                        return False
+                    if (other, pos) not in queued:
+                        queued.add( (other, pos) )
+                        pending.append( (other, pos) )
+        return True
+
+
+    def probe( self ):
+        """Failed literal probing: paint every cell left undecided by line
+        solving with each of its remaining colors in turn, line solve, and
+        drop the colors leading to a contradiction (fixing the cell when one
+        color is left), until no color drops. Returns False if some cell has
+        no color left. Changes are recorded on the trail."""
+        if not self.propagate():
+            return False
+        changed = True
+        while changed:
+            changed = False
+            for xid in range( self.nxs ):
+                for pos, d in enumerate( self.bits[self.X][xid] ):
+                    alive = self.alive[self.X][xid]
+                    if any( alive & b == alive for b in d.values() ):
+                        continue
+                    for code, b in d.items():
+                        if 0 == self.alive[self.X][xid] & b:
+                            continue
+                        mark = self.mark()
+                        self.restrict( self.X, xid, pos, code )
+                        feasible = self.propagate( [ (self.X, xid) ] )
+                        self.undo( mark )
+                        if not feasible:
+                            self.exclude( self.X, xid, pos, code )
+                            if not self.propagate( [ (self.X, xid) ] ):
+                                return False
+                            changed = True
+        return True
+
+
+    def count( self, axis, lid ):
+        return self.alive[axis][lid].bit_count()
+
+
+    def compatible( self, axis, lid ):
+        alive = self.alive[axis][lid]
+        return [ p for i, p in enumerate( self.placements[axis][lid] ) if alive >> i & 1 ]
+
+
+    def solved( self ):
+        return all( 1 == alive.bit_count() for alive in self.alive[self.X] + self.alive[self.Y] )
+
+
+    def grid( self ):
+        return [ self.line_cells( self.X, xid ) for xid in range( self.nxs ) ]
+
+
+if __name__ == '__main__':
+    # 2x2 grid, rows "2/1", columns "1/2"
+    b = lambda *idx: [ {"idx":i, "color":""} for i in idx ]
+    ls = LineSolver( [ [ b(0,1) ], [ b(0), b(1) ] ],
+                     [ [ b(0), b(1) ], [ b(0,1) ] ] )
+    print( ls.propagate(), ls.solved() )
+    print( ls )
@@ -1,21 +1,36 @@
 # Exploratory topic: Nonograms -- Japanese puzzle
 import argparse
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from matplotlib.colors import LinearSegmentedColormap, ListedColormap
+import colorsys
+import itertools
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
 
+import bitdlx
 import dlxplus
 import interference
+import linesolver
+import parallel
+import placecache
+import solcache
 
 _NONO_DIMS_SEPARATOR = "|"
 _NONO_LINE_SEPARATOR = "/"
 _NONO_SPEC_SEPARATOR = ","
+_NONO_APPEND_CHUNK   = 4096
+
+# NumPy and matplotlib are only imported by the functions plotting with them
 
 def plot_examples(colormaps):
     """
     Helper function to plot data with associated colormap.
     """
+    import numpy as np
+    import matplotlib.pyplot as plt
     np.random.seed(19680801)
     data = np.random.randn(30, 30)
     n = len(colormaps)
@@ -28,6 +43,7 @@ def plot_examples(colormaps):
 
     
 def nono_default_colors():
+    import matplotlib.colors as mcolors
     # Get a list of all named colors in Matplotlib
     allcolors = list( mcolors.CSS4_COLORS.keys() )
     lencolors = len(allcolors)
@@ -49,7 +65,11 @@ def nono_parse( str ):
 
 def nono_read( fn_puzzle ):
     with open(fn_puzzle, 'r') as file:
-        content = file.read()
+        return nono_loads( file.read() )
+
+
+def nono_loads( content ):
+    # Puzzle spec from the text of a puzzle file
     dims = content.split( _NONO_DIMS_SEPARATOR )
     rows = dims[0].split( _NONO_LINE_SEPARATOR )
     cols = dims[1].split( _NONO_LINE_SEPARATOR )
@@ -60,6 +80,8 @@ def nono_read( fn_puzzle ):
 
 
 def nono_plot( spec ):
+    import numpy as np
+    import matplotlib.pyplot as plt
     nrows, ncols = len(spec['rows']), len(spec['cols'])
     # plt.style.use('_mpl-gallery-nogrid')
     plt.style.use('classic')
@@ -76,79 +98,300 @@ def nono_plot( spec ):
     plt.show()
 
 
-def nono_block( iteration, start, blocks, n ):
-    def _nono_nextstart( b ):
-        if "" == b['color'] :
-            # BW
-            return b['size']+1
-        else:
-            # Color
-            return b['size']
-    
-    rows = []
-    if( iteration == len(blocks) ):
-        return []
+def _nono_nextstart( b ):
+    if "" == b['color'] :
+        # BW
+        return b['size']+1
     else:
-        # print( "Block {} ({}), Start {}".format( iteration, blocks[iteration], start ) )
-        for c in range( start, n - blocks[iteration]['size'] + 1 ):
-            c_row = []
-            # print("  Testing pos {}".format(c) )
-            seq = nono_block( iteration+1, c + _nono_nextstart( blocks[iteration] ), blocks, n )
-            c_row += [ {"idx":col, "color": blocks[iteration]['color']}  for col in range(c, c+blocks[iteration]['size']) ]
-            if 0 == len(seq):
-                if iteration == len(blocks)-1:
-                    rows += [ c_row ]
-            else:
-                for sequence in seq:
-                    rows += [ c_row + sequence ]
-
-    return rows
+        # Color
+        return b['size']
+
+
+def _nono_blocks( blocks, n ):
+    # Drop empty ("0") blocks, return the blocks and the free space they leave
+    blocks = [ b for b in blocks if b['size'] > 0 ]
+    length = sum( _nono_nextstart( b ) for b in blocks[:-1] ) + sum( b['size'] for b in blocks[-1:] )
+    return blocks, n - length
+
+
+def nono_placements( blocks, n ):
+    # Lazily enumerate the placements of blocks on a line of n cells, with the
+    # leftmost block moving slowest. A placement is described by the extra
+    # offsets of its blocks beyond their leftmost positions; these sum up to
+    # at most the slack of the line.
+    blocks, slack = _nono_blocks( blocks, n )
+    if slack < 0:
+        return
+    k = len(blocks)
+    offsets = [ 0 ] * k
+    total = 0
+    while True:
+        yield _nono_compact( blocks, offsets )
+        if 0 == k:
+            return
+        if total < slack:
+            offsets[-1] += 1
+            total += 1
+            continue
+        j = k - 1
+        while j >= 0 and 0 == offsets[j]:
+            j -= 1
+        if j <= 0:
+            return
+        total -= offsets[j] - 1
+        offsets[j] = 0
+        offsets[j-1] += 1
+
+
+def _nono_compact( blocks, offsets ):
+    compact, pos = [], 0
+    for b, offset in zip( blocks, offsets ):
+        pos += offset
+        compact += [ {"idx":col, "color": b['color']} for col in range(pos, pos+b['size']) ]
+        pos += _nono_nextstart( b )
+    return compact
+
+
+def nono_count( blocks, n ):
+    # Placing k blocks is choosing how to spread the slack over k+1 gaps
+    blocks, slack = _nono_blocks( blocks, n )
+    if slack < 0:
+        return 0
+    return math.comb( slack + len(blocks), len(blocks) )
+
+
+def nono_unrank( blocks, n, i ):
+    # The i-th placement in the order of nono_placements
+    blocks, slack = _nono_blocks( blocks, n )
+    if i < 0 or slack < 0 or i >= math.comb( slack + len(blocks), len(blocks) ):
+        raise IndexError( "placement index out of range" )
+    offsets = []
+    for j in range( len(blocks) ):
+        rest   = len(blocks) - j - 1
+        offset = 0
+        while True:
+            count = math.comb( slack - offset + rest, rest )
+            if i < count:
+                break
+            i -= count
+            offset += 1
+        offsets.append( offset )
+        slack -= offset
+    return _nono_compact( blocks, offsets )
+
+
+def nono_size( spec ):
+    # Number of DLX rows nono_solve builds without presolving
+    nrows, ncols = len(spec['rows']), len(spec['cols'])
+    return sum( nono_count( blocks, ncols ) for blocks in spec['rows'] ) + \
+           sum( nono_count( blocks, nrows ) for blocks in spec['cols'] )
+
 
-    
 def nono_setup_row( blocks, n ):
-    rows = nono_block( 0, 0, blocks, n )
-    # print( blocks, "-->", rows )
-    return rows
-    
-    
-def nono_solve( spec ):
+    # Placements come from the cache, they must not be modified
+    return _nono_cache.get( blocks, n )
+
+
+_nono_cache = placecache.PlacementCache( lambda blocks, n: list( nono_placements( blocks, n ) ) )
+
+
+def nono_set_cache( maxsize=placecache._PLACECACHE_MAXSIZE, path=None ):
+    # Bound the in-memory placement cache to maxsize placements, and share
+    # placements through an SQLite file at path if given
+    global _nono_cache
+    _nono_cache = placecache.PlacementCache( _nono_cache.compute, maxsize, path )
+    return _nono_cache
+
+
+def nono_linesolver( spec ):
+    nrows, ncols = len(spec['rows']), len(spec['cols'])
+    return linesolver.LineSolver( [ nono_setup_row( spec['rows'][row], ncols ) for row in range(nrows) ],
+                                  [ nono_setup_row( spec['cols'][col], nrows ) for col in range(ncols) ] )
+
+
+def nono_selector( d ):
+    # Column selector for a matrix from nono_solve: BitDLX has no interference
+    if isinstance( d, bitdlx.BitDLX ):
+        return bitdlx.BitDLX.smallestColumnSelector
+    return dlxplus.DLXplus.interferenceColumnSelector
+
+
+def _nono_cells( item, nrows, ncols ):
+    # Cell columns of a placement in the "cells" encoding: cell (row, col) is
+    # column nrows+ncols+row*ncols+col, colored with its color code + 1 so
+    # that white cells are colored too
+    n = ncols if 0 == item['entry_t'] else nrows
+    codes = [ 0 ] * n
+    for c in item['compact']:
+        codes[ c['idx'] ] = interference.color_code( c['color'] )
+    if 0 == item['entry_t']:
+        first, stride = nrows + ncols + item['entry']*ncols, 1
+    else:
+        first, stride = nrows + ncols + item['entry'], ncols
+    return [ (first + pos*stride, code + 1) for pos, code in enumerate( codes ) ]
+
+
+def _nono_append( d, entry_t, lid, placements, nrows, ncols, cells ):
+    # Append the (rank, placement) pairs of one line, a chunk at a time so
+    # that appendRows allocates the nodes of each chunk at once without the
+    # placements of the whole puzzle being held as rows
+    n = ncols if 0 == entry_t else nrows
+    column = lid if 0 == entry_t else nrows + lid
+    total_rows = []
+    while True:
+        chunk = list( itertools.islice( placements, _NONO_APPEND_CHUNK ) )
+        if not chunk:
+            return total_rows
+        d_rownames = [ { "compact": r, "masks": interference.placement_masks( r, n ), "rank": rank, "entry": lid, "entry_t": entry_t }
+                       for rank, r in chunk ]
+        if cells:
+            d_rows = [ [column] + _nono_cells( item, nrows, ncols ) for item in d_rownames ]
+        else:
+            d_rows = [ [column] for _ in d_rownames ]
+        total_rows += d.appendRows( d_rows, d_rownames )
+
+
+def _nono_options( encoding, backend, presolve, dynamic, propagate, probe, nogoods ):
+    # Options of nono_solve that do not apply together are refused rather
+    # than ignored. Returns dynamic, on by default with the lines encoding.
+    if encoding not in ( "lines", "cells" ):
+        raise ValueError( "Unknown encoding {!r}".format( encoding ) )
+    if backend not in ( "links", "bits" ):
+        raise ValueError( "Unknown backend {!r}".format( backend ) )
+    cells = "cells" == encoding
+    if "bits" == backend and not cells:
+        raise ValueError( "The bits backend needs the cells encoding" )
+    if cells and dynamic:
+        raise ValueError( "The cells encoding has no dynamic line order" )
+    if cells and nogoods:
+        raise ValueError( "Nogoods need the lines encoding" )
+    dynamic = not cells if None == dynamic else dynamic
+    if propagate and not dynamic:
+        raise ValueError( "Propagation needs the dynamic line order" )
+    if None != probe and not presolve:
+        raise ValueError( "Probing needs presolving" )
+    if probe and not dynamic:
+        raise ValueError( "Probing during the search needs the dynamic line order" )
+    return dynamic
+
+
+def nono_solve( spec, presolve=True, max_placements=None, dynamic=None, max_solutions=None, statistics=None,
+                encoding="lines", propagate=False, matrix=None, checkpoint=None, checkpoint_interval=60,
+                backend="links", probe=None, nogoods=None, deadline=None ):
+    # d.timings records the seconds spent on each stage of the set up.
+    # With the "cells" encoding every cell is a colored secondary column
+    # shared by the placements of its row and column, so DLX itself drops
+    # the placements conflicting with a selected line (Algorithm C) and
+    # no interference is needed, nor possible: dynamic, the line order by
+    # interference, is the default with the "lines" encoding only. With
+    # propagate (and dynamic), line solving runs to a fixpoint after every
+    # selection. Options that do not apply raise a ValueError.
+    # A matrix file saves the built matrix, or if it exists replaces the set
+    # up; it must have been built for the same puzzle with the same options
+    # (ValueError otherwise, see d.matrix_key). A checkpoint file
+    # saves the search as it goes (see dlx.AlgorithmX.solve and resume).
+    # The "bits" backend (bitdlx.BitDLX) needs the "cells" encoding.
+    # With probe, a list of search depths, presolving ends with failed
+    # literal probing (see LineSolver.probe), re-run during the search after
+    # the rows selected at these depths (dynamic only).
+    # With nogoods, a table size, the search remembers the cell states it
+    # found no solution from (lines encoding only, see DLXplus.set_nogoods).
+    # With deadline, a time.perf_counter() value, the search gives up once
+    # it is past, setting statistics.limited (see dlx.AlgorithmX.solve).
+    dynamic = _nono_options( encoding, backend, presolve, dynamic, propagate, probe, nogoods )
+    cells = "cells" == encoding
+    timings = { "placements": 0., "presolve": 0., "build": 0. }
+    clock = time.perf_counter()
+    # Everything the built matrix depends on
+    key = { "spec": solcache.spec_text( spec ), "presolve": presolve, "dynamic": dynamic, "encoding": encoding,
+            "propagate": propagate, "backend": backend, "probe": probe, "nogoods": nogoods }
+    if None != matrix and os.path.exists( matrix ):
+        # Either class loads any pickle; which one is checked with the key
+        d = ( bitdlx.BitDLX if "bits" == backend else dlxplus.DLXplus ).load( matrix )
+        saved = getattr( d, "matrix_key", {} )
+        differ = sorted( name for name in key if saved.get( name ) != key[name] )
+        if differ:
+            raise ValueError( "Matrix {} was built with a different {}".format( matrix, ", ".join( differ ) ) )
+        timings["load"] = time.perf_counter() - clock
+        d.timings = timings
+        return d, d.solve( nono_selector( d ), max_solutions=max_solutions, statistics=statistics,
+                           checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, deadline=deadline )
     nrows, ncols = len(spec['rows']), len(spec['cols'])
+    if None != max_placements and nono_size( spec ) > max_placements:
+        raise ValueError( "Puzzle has {} placements, more than {}".format( nono_size( spec ), max_placements ) )
     interf = interference.Interference( nrows, ncols )
     # Set up
     # columns = [ ("VAL_{}_{}".format(row,col), dlx.DLX.PRIMARY ) for row in range(nrows) for col in range(ncols) ]
     columns = []
     columns += [ ("ROW_{}".format(row), dlxplus.dlx.DLX.PRIMARY) for row in range(nrows) ]
     columns += [ ("COL_{}".format(col), dlxplus.dlx.DLX.PRIMARY) for col in range(ncols) ]
+    if cells:
+        columns += [ ("CELL_{}_{}".format(row,col), dlxplus.dlx.DLX.SECONDARY) for row in range(nrows) for col in range(ncols) ]
     # print( spec )
-    d = dlxplus.DLXplus( columns )
+    d = bitdlx.BitDLX( columns ) if "bits" == backend else dlxplus.DLXplus( columns )
     # print( d.interference )
-    d.set_interference( interf )
+    if not cells:
+        d.set_interference( interf )
+        d.set_nogoods( nogoods )
     # print( d.interference )
-    # Rows
+    if presolve or dynamic:
+        # Placements are ranked within their line in the line solver
+        solver = nono_linesolver( spec )
+        timings["placements"] = time.perf_counter() - clock
+        # Iterated line solving to a fixpoint drops every placement
+        # contradicting a cell fixed by its crossing lines. No placements
+        # survive if the puzzle has no solution.
+        feasible = solver.propagate() if presolve else True
+        if feasible and presolve and None != probe:
+            feasible = solver.probe()
+        timings["presolve"] = time.perf_counter() - clock - timings["placements"]
+        def _ranked( axis, lid ):
+            alive = solver.alive[axis][lid] if feasible else 0
+            return ( (rank, p) for rank, p in enumerate( solver.placements[axis][lid] ) if alive >> rank & 1 )
+        xplacements = [ _ranked( solver.X, row ) for row in range(nrows) ]
+        yplacements = [ _ranked( solver.Y, col ) for col in range(ncols) ]
+        if dynamic:
+            interf.track( solver, propagate )
+            d.set_probing( probe )
+    else:
+        xplacements = [ enumerate( nono_placements( spec['rows'][row], ncols ) ) for row in range(nrows) ]
+        yplacements = [ enumerate( nono_placements( spec['cols'][col], nrows ) ) for col in range(ncols) ]
+    # Rows: stream placements straight into the matrix
     total_rows = []
-    for row in range( len(spec['rows']) ):
-        rows = nono_setup_row( spec['rows'][row], ncols )
-        d_rows, d_rownames = [], []
-        for r in rows:
-            d_rows += [ [row] ]
-            d_rownames += [ { "compact": r, "entry": row, "entry_t": 0 } ]
-        total_rows += d.appendRows( d_rows, d_rownames )
+    for row in range( nrows ):
+        total_rows += _nono_append( d, 0, row, xplacements[row], nrows, ncols, cells )
     #
-    for col in range( len(spec['cols']) ):
-        rows = nono_setup_row( spec['cols'][col], ncols )
-        d_rows, d_rownames = [], []
-        for r in rows:
-            d_rows += [ [col+nrows] ]
-            d_rownames += [ { "compact": r, "entry": col, "entry_t": 1 } ]
-        total_rows += d.appendRows( d_rows, d_rownames )
+    for col in range( ncols ):
+        total_rows += _nono_append( d, 1, col, yplacements[col], nrows, ncols, cells )
+    timings["build"] = time.perf_counter() - clock - timings["placements"] - timings["presolve"]
+    d.timings = timings
+    if None != matrix:
+        d.matrix_key = key
+        d.save( matrix )
     # Solve
     # print( [ d.N[x] for x in total_rows] )
     # for sol in d.solve():
     #     d.printSolution(sol)
-    return d, d.solve()
+    if dynamic:
+        return d, d.solve( dlxplus.DLXplus.interferenceColumnSelector, max_solutions=max_solutions, statistics=statistics,
+                           checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, deadline=deadline )
+    return d, d.solve( max_solutions=max_solutions, statistics=statistics,
+                       checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, deadline=deadline )
 
 
-def nono_print_solution( spec, d, solution ):
+def nono_statistics( d ):
+    # Set up timings and search statistics of a solved puzzle as plain
+    # values, with interference rejections by line name
+    stats = d.statistics.as_dict()
+    stats["rejections"] = { d.N[c]: count for c, count in d.statistics.rejections.items() }
+    stats["timings"] = d.timings
+    if None != getattr( d, "nogoods", None ):
+        stats["nogoods"] = d.nogoods.as_dict()
+    return stats
+
+
+def nono_solution_rows( spec, d, solution ):
+    # One string per row: 0 for white, 1 for black, else the color
     def _nono_color( idx, a ):
         color = 0
         for c in a:
@@ -159,7 +402,7 @@ def nono_print_solution( spec, d, solution ):
 
     def _nono_to_string( arr ):
         str = ""
-        for j in range( len(spec['rows']) ):
+        for j in range( len(spec['cols']) ):
             str += "{}".format( _nono_color( j, arr ) )
         return str
     
@@ -171,38 +414,65 @@ def nono_print_solution( spec, d, solution ):
             rows_only += [{ 'compact': item['compact'], 'entry': item['entry'] }]
     rows_only = sorted( rows_only, key=lambda elt: elt['entry'] )
     # Convert to string representations
-    for i in rows_only:
-        print( _nono_to_string( i['compact'] ) )
-        
-    
+    return [ _nono_to_string( i['compact'] ) for i in rows_only ]
+
+
+def nono_solution_grid( spec, d, solution ):
+    # Color codes of the cells, row by row (see interference.color_code)
+    grid = [ [ 0 ] * len(spec['cols']) for _ in spec['rows'] ]
+    for i in solution:
+        item = d.N[i]
+        if 0 == item['entry_t']:
+            for c in item['compact']:
+                grid[ item['entry'] ][ c['idx'] ] = interference.color_code( c['color'] )
+    return grid
+
+
+def nono_grid_rows( grid ):
+    # Strings of the rows of a color code grid, as from nono_solution_rows
+    return [ "".join( "{}".format( code ) if code < 2 else chr( ord('a') + code - 2 ) for code in row ) for row in grid ]
+
+
+def nono_cached_solve( spec, cache, max_solutions=None, **options ):
+    # Solutions as color code grids, from a solcache.SolutionCache, or
+    # solved with nono_solve and stored on a miss. Returns the grids and the
+    # DLX, None when the cache answered.
+    grids = cache.get( spec, max_solutions )
+    if None != grids:
+        return grids, None
+    d, solutions = nono_solve( spec, max_solutions=max_solutions, **options )
+    return nono_cache_solutions( spec, cache, d, solutions, max_solutions ), d
+
+
+def nono_cache_solutions( spec, cache, d, solutions, max_solutions=None ):
+    # The grids of the solutions from nono_solve, stored in cache unless the
+    # search gave up early (statistics.limited)
+    try:
+        grids = [ nono_solution_grid( spec, d, sol ) for sol in solutions ]
+    finally:
+        solutions.close()
+    if not d.statistics.limited:
+        cache.put( spec, grids, None == max_solutions or len( grids ) < max_solutions )
+    return grids
+
+
+def nono_print_solution( spec, d, solution ):
+    for row in nono_solution_rows( spec, d, solution ):
+        print( row )
+
+
 def nono_plot_solution( spec, d, solution ):
-    def _nono_color( blk ):
-        if "" == blk['color']:
-            return 1.
-        ch = blk['color'][0].lower()
-        pt = (ord(ch)-ord('a')+1)/28. # + 1./56.
-        return pt
-    
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
     nrows, ncols = len(spec['rows']), len(spec['cols'])
     # plt.style.use('_mpl-gallery-nogrid')
     plt.style.use('classic')
-    image = np.zeros(nrows*ncols)
-    # Set color here
-    rows_only = []
-    # Collect solution by rows
-    for i in solution:
-        item = d.N[i]
-        if 0 == item['entry_t']:
-            rows_only += [{ 'compact': item['compact'], 'entry': item['entry'] }]
-    rows_only = sorted( rows_only, key=lambda elt: elt['entry'] )
-    # Convert to image representation
-    for i in rows_only:
-        x = i['entry'] # Should be == i by the way
-        for y in i['compact']:
-            compact_color = _nono_color( y )
-            image[ x*ncols + y['idx'] ] = compact_color
-    # Reshape things into a XxY grid.
-    image = image.reshape((nrows, ncols))
+    # Convert to image representation: black is 1., lettered colors are
+    # spread over ]0, 1[ to index nono_default_colors.
+    image = np.array( nono_solution_grid( spec, d, solution ), dtype=float ).reshape((nrows, ncols))
+    image = np.where( image > 1, (image-1)/28., image )
     row_labels = range(nrows)
     col_labels = range(ncols)
     # plt.matshow(image, cmap='Greys')
@@ -213,20 +483,153 @@ def nono_plot_solution( spec, d, solution ):
     plt.show()
 
 
+def nono_palette():
+    # RGB of each color code: white, black, then 26 hues for the letters
+    letters = [ colorsys.hsv_to_rgb( (i*7 % 26)/26., 0.7, 0.9 ) for i in range(26) ]
+    return [ (255, 255, 255), (0, 0, 0) ] + [ tuple( int(255*v) for v in rgb ) for rgb in letters ]
+
+
+def _nono_pixels( grid, scale ):
+    # Raw RGB rows of the grid, each cell a scale x scale square
+    palette = nono_palette()
+    lines = []
+    for row in grid:
+        line = b"".join( bytes( palette[code] ) * scale for code in row )
+        lines += [ line ] * scale
+    return lines
+
+
+def nono_write_ppm( grid, fn, scale=10 ):
+    lines = _nono_pixels( grid, scale )
+    with open( fn, 'wb' ) as file:
+        file.write( b"P6\n%d %d\n255\n" % (len(grid[0])*scale if grid else 0, len(lines)) )
+        file.write( b"".join( lines ) )
+
+
+def nono_write_png( grid, fn, scale=10 ):
+    def _chunk( tag, data ):
+        return struct.pack( ">I", len(data) ) + tag + data + struct.pack( ">I", zlib.crc32( tag + data ) )
+
+    lines = _nono_pixels( grid, scale )
+    header = struct.pack( ">IIBBBBB", len(grid[0])*scale if grid else 0, len(lines), 8, 2, 0, 0, 0 )
+    # Filter type 0 (none) in front of every scanline
+    data = zlib.compress( b"".join( b"\x00" + line for line in lines ) )
+    with open( fn, 'wb' ) as file:
+        file.write( b"\x89PNG\r\n\x1a\n" + _chunk( b"IHDR", header ) + _chunk( b"IDAT", data ) + _chunk( b"IEND", b"" ) )
+
+
+def _nono_output_name( output, default, index ):
+    # Number files after the first one, or where output has a {} placeholder
+    fn = output or default
+    if "{}" in fn:
+        return fn.format( index )
+    if index > 0:
+        stem, dot, ext = fn.rpartition( "." )
+        return "{}_{}.{}".format( stem, index, ext ) if dot else "{}_{}".format( fn, index )
+    return fn
+
+
+def _nono_output_text( spec, d, solution, index, output ):
+    print( "Solution:" )
+    nono_print_solution( spec, d, solution )
+
+
+def _nono_output_json( spec, d, solution, index, output ):
+    print( json.dumps( { "solution": index, "grid": nono_solution_rows( spec, d, solution ) } ) )
+    sys.stdout.flush()
+
+
+def _nono_output_ppm( spec, d, solution, index, output ):
+    nono_write_ppm( nono_solution_grid( spec, d, solution ), _nono_output_name( output, "solution.ppm", index ) )
+
+
+def _nono_output_png( spec, d, solution, index, output ):
+    nono_write_png( nono_solution_grid( spec, d, solution ), _nono_output_name( output, "solution.png", index ) )
+
+
+def _nono_output_plot( spec, d, solution, index, output ):
+    print( "Solution:" )
+    nono_plot_solution( spec, d, solution )
+
+
+# Output backends of the command line, by name
+_NONO_OUTPUTS = { "plot": _nono_output_plot,
+                  "text": _nono_output_text,
+                  "json": _nono_output_json,
+                  "ppm":  _nono_output_ppm,
+                  "png":  _nono_output_png }
+
+
 if __name__ == '__main__':
     # Create the parser
     parser = argparse.ArgumentParser(description="A simple nonogram solver.")
     # Add arguments
     parser.add_argument("puzzle", type=str, help="Puzzle file")
+    parser.add_argument("--no-presolve", action="store_true", help="Skip line solving before the search")
+    parser.add_argument("--max-placements", type=int, default=None, help="Refuse puzzles with more line placements")
+    parser.add_argument("--static-order", action="store_true", help="Choose lines by placement count only")
+    parser.add_argument("--encoding", choices=["lines", "cells"], default="lines",
+                        help="Check crossing lines by interference, or by colored cell columns")
+    parser.add_argument("--propagate", action="store_true", help="Line solve to a fixpoint after every selection")
+    parser.add_argument("--probe", type=int, nargs="*", default=None, metavar="DEPTH",
+                        help="Probe cells after line solving, and again after the selections at these search depths")
+    parser.add_argument("--nogoods", type=int, default=None, metavar="SIZE",
+                        help="Remember up to this many cell states without solutions, and prune them")
+    parser.add_argument("--backend", choices=["links", "bits"], default="links",
+                        help="Dancing links, or bitsets (with --encoding cells)")
+    parser.add_argument("--matrix", default=None, help="Load the built matrix from this file, or build and save it there")
+    parser.add_argument("--checkpoint", default=None, help="Save the search to this file as it goes")
+    parser.add_argument("--checkpoint-interval", type=float, default=60, help="Seconds between checkpoints")
+    parser.add_argument("--resume", default=None, help="Resume the search saved in this checkpoint file")
+    parser.add_argument("--max-solutions", type=int, default=None, help="Stop after this many solutions")
+    parser.add_argument("--unique", action="store_true", help="Only check whether the solution is unique")
+    parser.add_argument("--cache", default=None, help="SQLite file caching line placements")
+    parser.add_argument("--output", choices=sorted(_NONO_OUTPUTS), default="plot", help="How to report solutions")
+    parser.add_argument("--output-file", default=None, help="Image file name for ppm/png output, {} is the solution number")
+    parser.add_argument("--profile", default=None, help="Write search statistics as JSON to this file")
+    parser.add_argument("--collapsed", default=None, help="Write collapsed stacks for flame graphs to this file")
+    parser.add_argument("--processes", type=int, default=None, help="Solve on a pool of processes")
+    parser.add_argument("--split-depth", type=int, default=2, help="Search depth at which work is split among processes")
     # Parse the arguments
     args = parser.parse_args()
     #
+    if args.cache:
+        nono_set_cache( path=args.cache )
     spec = nono_read( args.puzzle )
-    print( "Puzzle size: {} x {} -- {} colors".format( len(spec['rows']),
-                                                       len(spec['cols']),
-                                                       len(list( mcolors.CSS4_COLORS.keys() )) ) )
-    d, solutions = nono_solve(spec)
+    if "json" != args.output:
+        print( "Puzzle size: {} x {} -- {} colors".format( len(spec['rows']),
+                                                           len(spec['cols']),
+                                                           len({ b['color'] for line in spec['rows'] + spec['cols'] for b in line }) ) )
+        print( "Placements: {}".format( nono_size( spec ) ) )
+    if args.resume:
+        d = dlxplus.dlx.AlgorithmX.load( args.resume )
+        solutions = d.resume( args.max_solutions, args.checkpoint, args.checkpoint_interval )
+    else:
+        try:
+            d, solutions = nono_solve(spec, presolve=not args.no_presolve, max_placements=args.max_placements,
+                                      dynamic=False if args.static_order else None, max_solutions=args.max_solutions, encoding=args.encoding,
+                                      propagate=args.propagate, matrix=args.matrix, backend=args.backend, probe=args.probe, nogoods=args.nogoods,
+                                      checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+                                      statistics=dlxplus.dlx.DLXStatistics( profile=bool( args.profile or args.collapsed ) ))
+        except ValueError as e:
+            parser.error( e )
+    if args.unique:
+        print( "Unique: {}".format( d.is_unique( nono_selector( d ) ) ) )
+        d = None
+    elif None != args.processes:
+        solutions = parallel.parallel_solve( d, nono_selector( d ),
+                                             depth=args.split_depth, processes=args.processes,
+                                             max_solutions=args.max_solutions )
     if None != d:
-        for sol in solutions:
-            print( "Solution:" )
-            nono_plot_solution( spec, d, sol )
+        # Closed here rather than whenever the interpreter gets to it
+        try:
+            for index, sol in enumerate( solutions ):
+                _NONO_OUTPUTS[ args.output ]( spec, d, sol, index, args.output_file )
+        finally:
+            solutions.close()
+        if args.profile:
+            with open( args.profile, 'w' ) as file:
+                json.dump( nono_statistics( d ), file )
+        if args.collapsed:
+            with open( args.collapsed, 'w' ) as file:
+                file.write( d.statistics.collapsed() )
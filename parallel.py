@@ -0,0 +1,78 @@
+# parallel.py - Solve DLX problems on a process pool by splitting the top of the search tree
+import multiprocessing
+import pickle
+
+import dlx
+
+# The problem as seen by a worker process, set once by _init
+_problem = None
+
+
+def _init( data ):
+    global _problem
+    _problem = pickle.loads( data )
+
+
+def _subproblem( task ):
+    # Force the rows of a prefix, enumerate the solutions below it and
+    # restore the matrix for the next task. Solution times count from the
+    # start of parallel_solve: perf_counter is the same clock in every
+    # process of the machine.
+    prefix, columnselector, columnselectoruserdata, max_solutions, start = task
+    d = _problem
+    for r in prefix:
+        assert( d.useRow( r ) )
+    statistics = dlx.DLXStatistics()
+    statistics.start = start
+    solutions = list( d.solve( columnselector, columnselectoruserdata, max_solutions, statistics ) )
+    for r in reversed( prefix ):
+        d.unuseRow( r )
+    return solutions, statistics, len( prefix )
+
+
+def parallel_solve( d, columnselector=dlx.DLX.smallestColumnSelector, columnselectoruserdata=None,
+                    depth=2, processes=None, max_solutions=None ):
+    """Enumerate the solutions of d (a dlx.DLX, or a dlxplus.DLXplus with its
+    interference) on a pool of processes.
+
+    The search is first run down to `depth` in this process; every partial
+    solution reached there is a subproblem, solved by a worker holding its
+    own copy of the matrix. Solutions are yielded as subproblems complete, so
+    their order differs from DLX.solve. d.statistics aggregates the counts of
+    all subproblems at their true depths.
+
+    The column selector and its userdata are sent to the workers, so they
+    must be picklable (module-level functions or DLX methods).
+
+    With max_solutions, each subproblem stops at that many solutions and the
+    pool is shut down once that many have been yielded."""
+
+    statistics = dlx.DLXStatistics()
+    prefixes = list( d.expand( depth, columnselector, columnselectoruserdata ) )
+    found = 0
+    statistics.merge( d.statistics )
+    d.statistics = statistics
+    if not prefixes:
+        return
+    tasks = [ (prefix, columnselector, columnselectoruserdata, max_solutions, statistics.start) for prefix in prefixes ]
+    with multiprocessing.Pool( processes, initializer=_init, initargs=(pickle.dumps( d ),) ) as pool:
+        for solutions, substatistics, offset in pool.imap_unordered( _subproblem, tasks ):
+            statistics.merge( substatistics, offset )
+            for solution in solutions:
+                yield solution
+                found += 1
+                if found == max_solutions:
+                    return
+
+
+if __name__ == '__main__':
+    columns = [('a',dlx.DLX.PRIMARY), ('b',dlx.DLX.PRIMARY), ('c',dlx.DLX.PRIMARY), ('d',dlx.DLX.SECONDARY), ('e',dlx.DLX.PRIMARY)]
+    d = dlx.DLX(columns)
+    rows = [[1,2,4],
+            [0,1,3],
+            [0],
+            [0,1,2,3,4]]
+    rowNames = ['row%i' % i for i in range(len(rows))]
+    d.appendRows(rows, rowNames)
+    for sol in parallel_solve(d, depth=1, processes=2):
+        d.printSolution(sol)
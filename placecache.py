@@ -0,0 +1,114 @@
+# placecache.py - Memoized line placements, with an in-process LRU and an optional on-disk store
+import contextlib
+import json
+import os
+import signal
+import sqlite3
+from collections import OrderedDict
+
+_PLACECACHE_MAXSIZE = 1 << 18
+
+
+@contextlib.contextmanager
+def alarm_blocked():
+    # Hold SIGALRM back for the duration, so that a time limit such as the
+    # one of batch.solve_spec only strikes once a cache write is through
+    blocked = signal.pthread_sigmask( signal.SIG_BLOCK, { signal.SIGALRM } )
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask( signal.SIG_SETMASK, blocked )
+
+
+class PlacementCache:
+    """Placements of clue sequences on lines, keyed by (clues with colors,
+    line length). Clues are normalized first, without empty blocks and
+    with lower case colors, and compute gets them that way.
+
+    Recent entries are kept in memory, up to maxsize placements in all; a
+    line with more placements than that is not kept. With a path, entries
+    are also stored as JSON in an SQLite file, which any number of
+    processes may share, so placements must be plain lists, dicts, strings
+    and numbers. Cached placement lists are shared between callers and must
+    not be modified."""
+
+    def __init__( self, compute, maxsize=_PLACECACHE_MAXSIZE, path=None ):
+        self.compute = compute
+        self.maxsize = maxsize
+        self.path    = path
+        self.entries = OrderedDict()
+        self.size    = 0
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+        self._db, self._pid = None, None
+
+
+    def __getstate__( self ):
+        # Connections do not cross processes, workers open their own
+        state = self.__dict__.copy()
+        state['_db'], state['_pid'] = None, None
+        return state
+
+
+    @staticmethod
+    def normalize( blocks ):
+        return [ { "size": b['size'], "color": b['color'].lower() } for b in blocks if b['size'] > 0 ]
+
+
+    @staticmethod
+    def key( blocks, n ):
+        # Of normalized blocks
+        return ( tuple( (b['size'], b['color']) for b in blocks ), n )
+
+
+    def _connect( self ):
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect( self.path, timeout=60 )
+            self._db.execute( "PRAGMA journal_mode=WAL" )
+            self._db.execute( "CREATE TABLE IF NOT EXISTS placements (key TEXT PRIMARY KEY, value TEXT)" )
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+
+    def get( self, blocks, n ):
+        blocks = self.normalize( blocks )
+        key = self.key( blocks, n )
+        placements = self.entries.get( key )
+        if None != placements:
+            self.entries.move_to_end( key )
+            self.hits += 1
+            return placements
+        if None != self.path:
+            db  = self._connect()
+            row = db.execute( "SELECT value FROM placements WHERE key = ?", (json.dumps( key ),) ).fetchone()
+            if None != row:
+                placements = json.loads( row[0] )
+                self.disk_hits += 1
+        if None == placements:
+            placements = self.compute( blocks, n )
+            self.misses += 1
+            if None != self.path:
+                with alarm_blocked():
+                    db.execute( "INSERT OR IGNORE INTO placements VALUES (?, ?)",
+                                (json.dumps( key ), json.dumps( placements, separators=(",", ":") )) )
+                    db.commit()
+        if len( placements ) <= self.maxsize:
+            self.entries[key] = placements
+            self.size += len( placements )
+            while self.size > self.maxsize:
+                _, evicted = self.entries.popitem( last=False )
+                self.size -= len( evicted )
+        return placements
+
+
+    def clear( self ):
+        self.entries.clear()
+        self.size = 0
+
+
+if __name__ == '__main__':
+    # Two placements per entry, at most four in memory
+    cache = PlacementCache( lambda blocks, n: [ (b['size'], n) for b in blocks ] * 2, maxsize=4 )
+    for size in [ 1, 2, 1, 3, 1, 2 ]:
+        cache.get( [ {"size": size, "color": "A"}, {"size": 0, "color": ""} ], 5 )
+    print( cache.hits, cache.misses, cache.size, list( cache.entries ) )
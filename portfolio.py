@@ -0,0 +1,128 @@
+# portfolio.py - Race solving strategies for a nonogram's first solution on separate processes
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import dlxplus
+import nono
+
+_PORTFOLIO_SELECTORS = { "smallest": dlxplus.dlx.DLX.smallestColumnSelector,
+                         "interference": dlxplus.DLXplus.interferenceColumnSelector,
+                         "random": dlxplus.DLXplus.randomInterferenceColumnSelector }
+
+
+def default_strategies( n ):
+    """n strategies: the deterministic ones first, then randomized tie-breaking
+    and row order with restarts, one seed each.
+
+    A strategy is a dict with a name, a selector (a key of
+    _PORTFOLIO_SELECTORS), a seed for the random ones, shuffle (relink the
+    rows in random order before each run), restarts (the node limit of the
+    first run, grown along the Luby sequence; None for a single complete
+    run) and options for nono_solve."""
+
+    strategies = [ { "name": "interference", "selector": "interference" },
+                   { "name": "propagate", "selector": "interference", "options": { "propagate": True } },
+                   { "name": "cells", "selector": "smallest", "options": { "encoding": "cells" } } ]
+    for seed in range( max( 0, n - len( strategies ) ) ):
+        strategies.append( { "name": "random-{}".format( seed ), "selector": "random", "seed": seed,
+                             "shuffle": True, "restarts": 256, "options": { "propagate": True } } )
+    return strategies[:n]
+
+
+def _luby( i ):
+    # i-th term (from 1) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ...
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while (1 << k) - 1 != i:
+        i -= (1 << (k-1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k-1)
+
+
+def run_strategy( spec, strategy ):
+    """Search for a first solution of spec the way strategy says, restarting
+    as long as runs hit their node limit. Returns a JSON-ready dict."""
+
+    rnd = random.Random( strategy.get("seed") )
+    selector = _PORTFOLIO_SELECTORS[ strategy.get("selector", "interference") ]
+    d, _ = nono.nono_solve( spec, **strategy.get("options", {}) )
+    result = { "strategy": strategy.get("name"), "nodes": 0, "restarts": 0 }
+    while True:
+        if strategy.get("shuffle"):
+            d.shuffleRows( rnd )
+        limit = None
+        if None != strategy.get("restarts"):
+            limit = strategy["restarts"] * _luby( result["restarts"] + 1 )
+        statistics = dlxplus.dlx.DLXStatistics()
+        solutions = list( d.solve( selector, rnd, max_solutions=1, statistics=statistics, max_nodes=limit ) )
+        result["nodes"] += sum( statistics.nodes )
+        if solutions:
+            result["status"] = "solved"
+            result["grid"] = nono.nono_solution_rows( spec, d, solutions[0] )
+            return result
+        if not statistics.limited:
+            result["status"] = "unsolvable"
+            return result
+        result["restarts"] += 1
+
+
+def _race( spec, strategy, results ):
+    try:
+        result = run_strategy( spec, strategy )
+    except Exception as e:
+        result = { "strategy": strategy.get("name"), "status": "error", "error": "{}: {}".format( type(e).__name__, e ) }
+    results.put( result )
+
+
+def portfolio_solve( spec, strategies=None, timeout=None ):
+    """Run every strategy (default_strategies of one per CPU by default) in
+    its own process, and return the result of the first one to find a
+    solution or to prove there is none. The other processes are then
+    terminated. The status is "timeout" if none finished in time, or
+    "error" if they all failed."""
+
+    strategies = strategies or default_strategies( os.cpu_count() or 1 )
+    start = time.perf_counter()
+    results = multiprocessing.Queue()
+    processes = [ multiprocessing.Process( target=_race, args=( spec, strategy, results ), daemon=True )
+                  for strategy in strategies ]
+    for process in processes:
+        process.start()
+    result = { "status": "timeout" }
+    try:
+        for _ in processes:
+            remaining = None if None == timeout else max( 0, timeout - (time.perf_counter() - start) )
+            try:
+                result = results.get( timeout=remaining )
+            except queue.Empty:
+                result = { "status": "timeout" }
+                break
+            if "error" != result["status"]:
+                break
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Race solving strategies for the first solution of a nonogram.")
+    parser.add_argument("puzzle", type=str, help="Puzzle file")
+    parser.add_argument("--strategies", type=int, default=None, help="Number of strategies, one process each (default: one per CPU)")
+    parser.add_argument("--timeout", type=float, default=None, help="Time limit in seconds")
+    args = parser.parse_args()
+    #
+    spec = nono.nono_read( args.puzzle )
+    strategies = default_strategies( args.strategies ) if args.strategies else None
+    print( json.dumps( portfolio_solve( spec, strategies, args.timeout ) ) )
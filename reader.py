@@ -0,0 +1,278 @@
+# reader.py - Stream puzzles out of large multi-puzzle files: one per line, .non, and webpbn XML
+import argparse
+import gzip
+import os
+import re
+import sys
+from xml.parsers import expat
+
+import nono
+import solcache
+
+_READER_FORMATS = { ".txt": "lines", ".non": "non", ".xml": "xml", ".pbn": "xml" }
+_READER_CLUE    = re.compile( r"\s*\d+\s*[A-Za-z]*\s*$" )
+_READER_CHUNK   = 1 << 16
+
+
+class PuzzleParseError( ValueError ):
+    """A puzzle that does not parse, with where the problem is: path, line
+    and column (from 1, None when not known)."""
+
+    def __init__( self, message, path=None, line=None, column=None ):
+        self.message, self.path, self.line, self.column = message, path, line, column
+        where = ":".join( str( x ) for x in ( path, line, column ) if None != x )
+        super().__init__( "{}: {}".format( where, message ) if where else message )
+
+
+    def __reduce__( self ):
+        return ( PuzzleParseError, ( self.message, self.path, self.line, self.column ) )
+
+
+def puzzle_format( path ):
+    # Format of a puzzle file by its extension, ignoring .gz
+    base = path[:-3] if path.endswith( ".gz" ) else path
+    return _READER_FORMATS.get( os.path.splitext( base )[1].lower(), "lines" )
+
+
+def _open( path, binary=False ):
+    if path.endswith( ".gz" ):
+        return gzip.open( path, 'rb' if binary else 'rt', encoding=None if binary else 'utf-8' )
+    return open( path, 'rb' ) if binary else open( path, 'r', encoding='utf-8' )
+
+
+def loads_checked( text, path=None, line=None ):
+    # nono_loads( text ), once every clue was checked, so that errors come
+    # with their column instead of as whatever nono_parse makes of them
+    dims = text.split( nono._NONO_DIMS_SEPARATOR )
+    if 2 != len( dims ):
+        raise PuzzleParseError( "expected rows and columns separated by one {!r}".format( nono._NONO_DIMS_SEPARATOR ),
+                                path, line, 1 )
+    column = 1
+    for dim in dims:
+        for clues in dim.split( nono._NONO_LINE_SEPARATOR ):
+            for clue in clues.split( nono._NONO_SPEC_SEPARATOR ):
+                if not _READER_CLUE.match( clue ):
+                    raise PuzzleParseError( "bad clue {!r}".format( clue ), path, line, column )
+                column += len( clue ) + 1
+    return nono.nono_loads( text )
+
+
+def _read_lines( path, file ):
+    # One puzzle per line in the nono_read syntax; blank lines and lines
+    # starting with # are skipped
+    for number, text in enumerate( file, 1 ):
+        text = text.strip()
+        if text and not text.startswith( "#" ):
+            yield "{}:{}".format( path, number ), loads_checked( text, path, number )
+
+
+def _read_non( path, file ):
+    # Keyword lines ("width 5", "rows", ...); "rows" and "columns" are
+    # followed by one clue line per line of the grid, "0" for none. Blank
+    # lines are skipped. A keyword seen before in the current puzzle starts
+    # the next one, so .non files may be concatenated.
+    puzzle, keywords, section = None, set(), None
+
+    def _spec():
+        for name in ( "rows", "columns" ):
+            if name not in puzzle:
+                raise PuzzleParseError( "puzzle has no {}".format( name ), path, puzzle["start"] )
+        for name, size in ( ("rows", "height"), ("columns", "width") ):
+            if None != puzzle.get( size ) and puzzle[size] != len( puzzle[name] ):
+                raise PuzzleParseError( "{} {} but {} {}".format( size, puzzle[size], len( puzzle[name] ), name ),
+                                        path, puzzle["start"] )
+        text = nono._NONO_DIMS_SEPARATOR.join( nono._NONO_LINE_SEPARATOR.join( puzzle[name] )
+                                               for name in ( "rows", "columns" ) )
+        return "{}:{}".format( path, puzzle["start"] ), nono.nono_loads( text )
+
+    for number, text in enumerate( file, 1 ):
+        text = text.strip()
+        if not text:
+            continue
+        if text[0].isdigit():
+            if None == section:
+                raise PuzzleParseError( "clue outside of rows and columns", path, number, 1 )
+            clues = [ clue for clue in re.split( r"[\s,]+", text ) if clue ]
+            for clue in clues:
+                if not _READER_CLUE.match( clue ):
+                    raise PuzzleParseError( "bad clue {!r}".format( clue ), path, number, text.index( clue ) + 1 )
+            puzzle[section].append( nono._NONO_SPEC_SEPARATOR.join( clues ) )
+            continue
+        keyword, _, value = text.partition( " " )
+        keyword = keyword.lower()
+        if keyword in keywords:
+            yield _spec()
+            puzzle, keywords = None, set()
+        if None == puzzle:
+            puzzle = { "start": number }
+        keywords.add( keyword )
+        section = keyword if keyword in ( "rows", "columns" ) else None
+        if None != section:
+            puzzle[section] = []
+        elif keyword in ( "width", "height" ):
+            if not value.strip().isdigit():
+                raise PuzzleParseError( "bad {} {!r}".format( keyword, value.strip() ), path, number, len( keyword ) + 2 )
+            puzzle[keyword] = int( value )
+    if None != puzzle:
+        yield _spec()
+
+
+class _XMLPuzzles:
+    # expat handlers collecting the puzzles of a webpbn XML puzzle set. Clue
+    # colors are named; with one color besides the background it is black,
+    # with more they become letters in the order they are declared in.
+
+    def __init__( self, path, parser ):
+        self.path, self.parser = path, parser
+        self.done = []
+        self.puzzle, self.clues, self.line, self.count = None, None, None, None
+        self.text = ""
+        parser.StartElementHandler  = self.start
+        parser.EndElementHandler    = self.end
+        parser.CharacterDataHandler = self.data
+
+
+    def error( self, message, where=None ):
+        line, column = where or ( self.parser.CurrentLineNumber, self.parser.CurrentColumnNumber + 1 )
+        return PuzzleParseError( message, self.path, line, column )
+
+
+    def start( self, name, attrs ):
+        where = ( self.parser.CurrentLineNumber, self.parser.CurrentColumnNumber + 1 )
+        self.text = ""
+        if "puzzle" == name:
+            if "grid" != attrs.get( "type", "grid" ):
+                raise self.error( "unsupported puzzle type {!r}".format( attrs["type"] ) )
+            self.puzzle = { "start": where, "id": None, "colors": [], "rows": None, "columns": None,
+                            "background": attrs.get( "backgroundcolor", "white" ),
+                            "default": attrs.get( "defaultcolor", "black" ) }
+        elif None == self.puzzle:
+            return
+        elif "color" == name and None == self.clues:
+            self.puzzle["colors"].append( attrs.get( "name" ) )
+        elif "clues" == name:
+            if attrs.get( "type" ) not in ( "rows", "columns" ):
+                raise self.error( "clues of type {!r}".format( attrs.get( "type" ) ) )
+            self.clues = attrs["type"]
+            self.puzzle[self.clues] = []
+        elif "line" == name and None != self.clues:
+            self.line = ( where, [] )
+        elif "count" == name and None != self.line:
+            self.count = ( where, attrs.get( "color", self.puzzle["default"] ) )
+
+
+    def end( self, name ):
+        if None == self.puzzle:
+            return
+        if "count" == name and None != self.count:
+            where, color = self.count
+            if not self.text.strip().isdigit():
+                raise self.error( "bad count {!r}".format( self.text.strip() ), where )
+            self.line[1].append( ( int( self.text ), color, where ) )
+            self.count = None
+        elif "line" == name and None != self.line:
+            self.puzzle[self.clues].append( self.line )
+            self.line = None
+        elif "clues" == name:
+            self.clues = None
+        elif "id" == name:
+            self.puzzle["id"] = self.text.strip()
+        elif "puzzle" == name:
+            self.done.append( self.spec() )
+            self.puzzle = None
+
+
+    def data( self, text ):
+        self.text += text
+
+
+    def spec( self ):
+        puzzle = self.puzzle
+        for name in ( "rows", "columns" ):
+            if None == puzzle[name]:
+                raise self.error( "puzzle has no {} clues".format( name ), puzzle["start"] )
+        colors = [ color for color in puzzle["colors"] if color != puzzle["background"] ]
+        for name in ( "rows", "columns" ):
+            for _, counts in puzzle[name]:
+                colors += [ color for _, color, _ in counts if color not in colors ]
+        if len( colors ) > 26:
+            raise self.error( "{} colors, at most 26 are supported".format( len( colors ) ), puzzle["start"] )
+        letters = { colors[0]: "" } if 1 == len( colors ) else \
+                  { color: chr( ord('a') + i ) for i, color in enumerate( colors ) }
+        text = []
+        for name in ( "rows", "columns" ):
+            lines = []
+            for _, counts in puzzle[name]:
+                for ( _, color, _ ), ( _, other, where ) in zip( counts, counts[1:] ):
+                    if color == other and "" != letters[color]:
+                        # Colored blocks need no gap between them here
+                        raise self.error( "consecutive {} blocks need a gap, which colored blocks do not have"
+                                          .format( color ), where )
+                lines.append( nono._NONO_SPEC_SEPARATOR.join( "{}{}".format( size, letters[color] )
+                                                              for size, color, _ in counts ) or "0" )
+            text.append( nono._NONO_LINE_SEPARATOR.join( lines ) )
+        name = puzzle["id"] or "{}:{}".format( *puzzle["start"] )
+        return "{}:{}".format( self.path, name ), nono.nono_loads( nono._NONO_DIMS_SEPARATOR.join( text ) )
+
+
+def _read_xml( path, file ):
+    # Incremental parsing: only the puzzle being read is held in memory
+    parser = expat.ParserCreate()
+    puzzles = _XMLPuzzles( path, parser )
+    while True:
+        chunk = file.read( _READER_CHUNK )
+        try:
+            parser.Parse( chunk, not chunk )
+        except expat.ExpatError as e:
+            yield from puzzles.done
+            raise PuzzleParseError( expat.errors.messages[e.code], path, e.lineno, e.offset + 1 ) from None
+        except PuzzleParseError:
+            # Raised by a handler: the puzzles before it in the chunk come first
+            yield from puzzles.done
+            raise
+        yield from puzzles.done
+        puzzles.done.clear()
+        if not chunk:
+            return
+
+
+_READERS = { "lines": _read_lines, "non": _read_non, "xml": _read_xml }
+
+
+def read_puzzles( path, format=None ):
+    """Yield (name, spec) for every puzzle of the file at path, as they are
+    read. The format is "lines" (one puzzle per line in the nono_read
+    syntax), "non" or "xml" (webpbn), by default from the extension, and the
+    file may be gzipped. Names are the path with the line of the puzzle, or
+    its id in XML. Raises PuzzleParseError at the first puzzle that does
+    not parse."""
+
+    format = format or puzzle_format( path )
+    with _open( path, "xml" == format ) as file:
+        yield from _READERS[format]( path, file )
+
+
+def read_corpus( paths, format=None ):
+    # Puzzles of several files in a row
+    for path in paths:
+        yield from read_puzzles( path, format )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check puzzle files, or convert them to one puzzle per line.")
+    parser.add_argument("paths", nargs="+", help="Puzzle files (.txt, .non, .xml, maybe gzipped)")
+    parser.add_argument("--format", choices=sorted(_READERS), default=None, help="Format of all files (default: by extension)")
+    parser.add_argument("--convert", action="store_true", help="Print every puzzle in the nono_read syntax, one per line")
+    args = parser.parse_args()
+    #
+    count = 0
+    try:
+        for name, spec in read_corpus( args.paths, args.format ):
+            if args.convert:
+                print( "# {}\n{}".format( name, solcache.spec_text( spec ) ) )
+            count += 1
+    except PuzzleParseError as e:
+        print( e, file=sys.stderr )
+        sys.exit( 1 )
+    if not args.convert:
+        print( "{} puzzles".format( count ) )
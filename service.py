@@ -0,0 +1,350 @@
+# service.py - Local nonogram solver service: line-delimited JSON over a Unix socket
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+import nono
+import solcache
+
+# nono_solve options a request may set
+_SERVICE_OPTIONS = ( "presolve", "dynamic", "encoding", "propagate", "max_placements", "backend", "probe", "nogoods" )
+
+
+def worker_main( solutions=None ):
+    # Worker process: one JSON job per line on stdin, JSON events on stdout.
+    # Placements stay cached across jobs. With solutions, the path of a
+    # solcache.SolutionCache file, solutions are looked up there first and
+    # only come once the puzzle is solved.
+    cache = solcache.SolutionCache( solutions ) if solutions else None
+    for line in sys.stdin:
+        job = json.loads( line )
+        done = { "event": "done", "status": "error", "solutions": 0 }
+        search = None
+        try:
+            spec = nono.nono_loads( job["puzzle"] )
+            if None != cache:
+                grids, d = nono.nono_cached_solve( spec, cache, job.get("max_solutions"), **job.get("options", {}) )
+                found = ( nono.nono_grid_rows( grid ) for grid in grids )
+                done["cached"] = None == d
+            else:
+                d, search = nono.nono_solve( spec, max_solutions=job.get("max_solutions"), **job.get("options", {}) )
+                found = ( nono.nono_solution_rows( spec, d, sol ) for sol in search )
+            for rows in found:
+                sys.stdout.write( json.dumps( { "event": "solution", "index": done["solutions"], "grid": rows } ) + '\n' )
+                sys.stdout.flush()
+                done["solutions"] += 1
+            done["status"] = "solved" if done["solutions"] else "unsolvable"
+            if None != d:
+                done["nodes"] = sum( d.statistics.nodes )
+        except Exception as e:
+            done["error"] = "{}: {}".format( type(e).__name__, e )
+        finally:
+            if None != search:
+                search.close()
+        sys.stdout.write( json.dumps( done ) + '\n' )
+        sys.stdout.flush()
+
+
+def _check_request( request ):
+    # Solve request fields that go on to the worker and asyncio unchecked
+    def _number( value ):
+        return isinstance( value, ( int, float ) ) and not isinstance( value, bool )
+    timeout = request.get("timeout")
+    if None != timeout and not ( _number( timeout ) and timeout > 0 ):
+        raise ValueError( "timeout must be a positive number, got {!r}".format( timeout ) )
+    max_solutions = request.get("max_solutions")
+    if None != max_solutions and not ( isinstance( max_solutions, int ) and not isinstance( max_solutions, bool ) ):
+        raise ValueError( "max_solutions must be an integer, got {!r}".format( max_solutions ) )
+    if not isinstance( request.get("options", {}), dict ):
+        raise ValueError( "options must be an object, got {!r}".format( request["options"] ) )
+
+
+class _Job:
+    def __init__( self, id, request, send ):
+        self.id = id
+        self.request = request
+        self.send = send
+        self.timeout = request.get("timeout")
+        self.queued = time.perf_counter()
+        self.started = None
+        self.first = None
+        self.solutions = 0
+        self.running = None
+        self.cancelled = False
+
+
+class SolverService:
+    """Solve puzzles sent over a Unix socket on a pool of worker processes.
+
+    Every line a client sends is a JSON request:
+      {"op": "solve", "id": ..., "puzzle": "<nono_read text>", "max_solutions": n,
+       "timeout": seconds, "options": {...nono_solve options...}}
+      {"op": "cancel", "id": ...}
+      {"op": "metrics"}
+    and every line sent back a JSON event: "solution" events as they are
+    found and one "done" event per solve request (status solved,
+    unsolvable, timeout, cancelled or error), a "cancel" event answering a
+    cancel and a "metrics" event. Invalid requests get an "error" event
+    with their op instead. Solve ids default to a counter.
+
+    A worker is killed and replaced when its job is cancelled or runs out
+    of time; closing a connection cancels its jobs. With solutions, the path
+    of a solcache.SolutionCache file, workers answer repeated puzzles from
+    there."""
+
+    def __init__( self, path, workers=None, history=1000, solutions=None ):
+        self.path = path
+        self.solutions = solutions
+        self.nworkers = workers or os.cpu_count() or 1
+        self.queue = asyncio.Queue()
+        self.jobs = {}
+        self.ids = itertools.count()
+        self.running = 0
+        self.completed = {}
+        # Seconds spent waiting in the queue, to the first solution and in
+        # all, for the most recent jobs
+        self.waits = deque( maxlen=history )
+        self.firsts = deque( maxlen=history )
+        self.latencies = deque( maxlen=history )
+
+
+    async def serve( self ):
+        # Runs until cancelled, or interrupted by SIGINT or SIGTERM
+        loop = asyncio.get_running_loop()
+        for signum in ( signal.SIGINT, signal.SIGTERM ):
+            loop.add_signal_handler( signum, asyncio.current_task().cancel )
+        server = await asyncio.start_unix_server( self._client, self.path )
+        pool = [ asyncio.create_task( self._worker() ) for _ in range( self.nworkers ) ]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in pool:
+                task.cancel()
+            await asyncio.gather( *pool, return_exceptions=True )
+
+
+    def metrics( self ):
+        def _summary( values ):
+            if not values:
+                return None
+            values = sorted( values )
+            return { "count": len( values ),
+                     "mean": sum( values ) / len( values ),
+                     "p50": values[ len( values ) // 2 ],
+                     "p95": values[ min( len( values ) - 1, int( 0.95 * len( values ) ) ) ],
+                     "max": values[-1] }
+        return { "event": "metrics",
+                 "workers": self.nworkers,
+                 "queued": self.queue.qsize(),
+                 "running": self.running,
+                 "completed": dict( self.completed ),
+                 "wait": _summary( self.waits ),
+                 "first_solution": _summary( self.firsts ),
+                 "latency": _summary( self.latencies ) }
+
+
+    async def _client( self, reader, writer ):
+        lock = asyncio.Lock()
+        mine = []
+
+        async def send( event ):
+            async with lock:
+                writer.write( json.dumps( event ).encode() + b'\n' )
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                op = None
+                try:
+                    request = json.loads( line )
+                    op = request.get("op", "solve")
+                    if "solve" == op:
+                        if not isinstance( request.get("puzzle"), str ):
+                            raise ValueError( "solve needs a puzzle" )
+                        _check_request( request )
+                        id = request.get("id")
+                        if None == id:
+                            id = next( self.ids )
+                        if id in self.jobs:
+                            raise ValueError( "id {} is in use".format( id ) )
+                        job = _Job( id, request, send )
+                        self.jobs[id] = job
+                        mine.append( job )
+                        self.queue.put_nowait( job )
+                    elif "cancel" == op:
+                        await send( { "event": "cancel", "id": request.get("id"),
+                                      "found": self.cancel( request.get("id") ) } )
+                    elif "metrics" == op:
+                        await send( self.metrics() )
+                    else:
+                        raise ValueError( "unknown op {}".format( op ) )
+                except ( ValueError, TypeError, AttributeError ) as e:
+                    await send( { "event": "error", "op": op, "error": "{}: {}".format( type(e).__name__, e ) } )
+        except ( ConnectionError, asyncio.IncompleteReadError ):
+            pass
+        finally:
+            for job in mine:
+                self.cancel( job.id )
+            writer.close()
+
+
+    def cancel( self, id ):
+        job = self.jobs.get( id )
+        if None == job:
+            return False
+        job.cancelled = True
+        if None != job.running:
+            job.running.cancel()
+        return True
+
+
+    async def _spawn( self ):
+        cache = [ "--solutions", self.solutions ] if self.solutions else []
+        return await asyncio.create_subprocess_exec( sys.executable, os.path.abspath( __file__ ), "--worker", *cache,
+                                                     stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                                                     limit=2**24 )
+
+
+    async def _worker( self ):
+        process = await self._spawn()
+        try:
+            while True:
+                job = await self.queue.get()
+                done = { "event": "done", "id": job.id, "status": "cancelled", "solutions": 0 }
+                if not job.cancelled:
+                    self.running += 1
+                    job.started = time.perf_counter()
+                    job.running = asyncio.ensure_future( self._relay( process, job ) )
+                    restart = True
+                    try:
+                        done.update( await asyncio.wait_for( job.running, job.timeout ) )
+                        restart = False
+                    except asyncio.TimeoutError:
+                        done["status"] = "timeout"
+                    except asyncio.CancelledError:
+                        if not job.cancelled:
+                            raise
+                    except Exception as e:
+                        # Whatever went wrong, it was this job; the worker
+                        # process is replaced and the pool keeps its size
+                        done["status"], done["error"] = "error", "{}: {}".format( type(e).__name__, e )
+                    finally:
+                        self.running -= 1
+                    if restart:
+                        # The worker may be in the middle of a search
+                        process.kill()
+                        await process.wait()
+                        process = await self._spawn()
+                    done["solutions"] = job.solutions
+                    now = time.perf_counter()
+                    done["seconds"] = now - job.started
+                    self.waits.append( job.started - job.queued )
+                    self.latencies.append( now - job.queued )
+                    if None != job.first:
+                        self.firsts.append( job.first - job.queued )
+                self.completed[ done["status"] ] = self.completed.get( done["status"], 0 ) + 1
+                del self.jobs[ job.id ]
+                try:
+                    await job.send( done )
+                except ConnectionError:
+                    pass
+        finally:
+            if None == process.returncode:
+                process.kill()
+                await process.wait()
+
+
+    async def _relay( self, process, job ):
+        # Forward the solutions of a job to its client, return the worker's
+        # done event
+        work = { "puzzle": job.request["puzzle"], "max_solutions": job.request.get("max_solutions"),
+                 "options": { k: v for k, v in job.request.get("options", {}).items() if k in _SERVICE_OPTIONS } }
+        process.stdin.write( json.dumps( work ).encode() + b'\n' )
+        await process.stdin.drain()
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                raise EOFError( "worker exited" )
+            event = json.loads( line )
+            if "done" == event["event"]:
+                event.pop( "event" )
+                return event
+            if None == job.first:
+                job.first = time.perf_counter()
+            job.solutions += 1
+            event["id"] = job.id
+            await job.send( event )
+
+
+async def service_request( path, requests ):
+    """Send requests to a service and yield the events coming back, until
+    every solve request is done."""
+
+    reader, writer = await asyncio.open_unix_connection( path, limit=2**24 )
+    try:
+        pending = 0
+        for request in requests:
+            writer.write( json.dumps( request ).encode() + b'\n' )
+            pending += 1 if "solve" == request.get("op", "solve") else 0
+        await writer.drain()
+        answers = len( requests ) - pending
+        while pending or answers:
+            line = await reader.readline()
+            if not line:
+                break
+            event = json.loads( line )
+            if "done" == event["event"] or ( "error" == event["event"] and "solve" == event["op"] ):
+                pending -= 1
+            elif event["event"] in ( "cancel", "metrics", "error" ):
+                answers -= 1
+            yield event
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local nonogram solver service over a Unix socket.")
+    parser.add_argument("--socket", default="nono.sock", help="Unix socket path")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--send", nargs="*", default=None, help="Send these puzzle files to a running service and print the events")
+    parser.add_argument("--max-solutions", type=int, default=None, help="With --send, stop each puzzle at this many solutions")
+    parser.add_argument("--timeout", type=float, default=None, help="With --send, time limit per puzzle in seconds")
+    parser.add_argument("--metrics", action="store_true", help="Print the metrics of a running service")
+    parser.add_argument("--solutions", default=None, help="SQLite file caching solutions across requests and runs")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    #
+    if args.worker:
+        worker_main( args.solutions )
+    elif None != args.send or args.metrics:
+        requests = []
+        for fn in args.send or []:
+            with open( fn, 'r' ) as file:
+                requests.append( { "op": "solve", "id": fn, "puzzle": file.read(),
+                                   "max_solutions": args.max_solutions, "timeout": args.timeout } )
+        if args.metrics:
+            requests.append( { "op": "metrics" } )
+        async def _print():
+            async for event in service_request( args.socket, requests ):
+                print( json.dumps( event ), flush=True )
+        asyncio.run( _print() )
+    else:
+        if os.path.exists( args.socket ):
+            os.unlink( args.socket )
+        try:
+            asyncio.run( SolverService( args.socket, args.workers, solutions=args.solutions ).serve() )
+        except ( KeyboardInterrupt, asyncio.CancelledError ):
+            pass
+        finally:
+            if os.path.exists( args.socket ):
+                os.unlink( args.socket )
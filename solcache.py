@@ -0,0 +1,146 @@
+# solcache.py - Persistent puzzle solutions, keyed by a canonical form up to transposition and mirroring
+import hashlib
+import json
+import os
+import sqlite3
+
+import placecache
+
+
+def spec_text( spec ):
+    # The puzzle in the nono_read format, without empty blocks
+    def _line( blocks ):
+        return ",".join( "{}{}".format( b['size'], b['color'] ) for b in blocks if b['size'] > 0 ) or "0"
+    return "/".join( map( _line, spec['rows'] ) ) + "|" + "/".join( map( _line, spec['cols'] ) )
+
+
+def _mirrorable( spec ):
+    # Reversing a line maps a puzzle to its mirror image only if the gaps
+    # between blocks stay the same: a black block needs a gap after it and
+    # a colored one does not, so no line may have both next to each other.
+    for blocks in spec['rows'] + spec['cols']:
+        blocks = [ b for b in blocks if b['size'] > 0 ]
+        for b, c in zip( blocks, blocks[1:] ):
+            if ( "" == b['color'] ) != ( "" == c['color'] ):
+                return False
+    return True
+
+
+def transforms( spec ):
+    # (flip rows, flip columns, transpose) mapping the puzzle to an
+    # equivalent one, identity first
+    flips = [ (False, False), (True, False), (False, True), (True, True) ] if _mirrorable( spec ) else [ (False, False) ]
+    return [ (flip_rows, flip_cols, transpose) for transpose in ( False, True ) for flip_rows, flip_cols in flips ]
+
+
+def transform_spec( spec, t ):
+    flip_rows, flip_cols, transpose = t
+    rows, cols = spec['rows'], spec['cols']
+    if flip_rows:
+        rows, cols = rows[::-1], [ col[::-1] for col in cols ]
+    if flip_cols:
+        rows, cols = [ row[::-1] for row in rows ], cols[::-1]
+    if transpose:
+        rows, cols = cols, rows
+    return { "rows": rows, "cols": cols }
+
+
+def transform_grid( grid, t ):
+    # Solution of spec (a list of rows) to the solution of transform_spec( spec, t )
+    flip_rows, flip_cols, transpose = t
+    if flip_rows:
+        grid = grid[::-1]
+    if flip_cols:
+        grid = [ row[::-1] for row in grid ]
+    if transpose:
+        grid = [ list( col ) for col in zip( *grid ) ]
+    return [ list( row ) for row in grid ]
+
+
+def untransform_grid( grid, t ):
+    flip_rows, flip_cols, transpose = t
+    if transpose:
+        grid = [ list( col ) for col in zip( *grid ) ]
+    return transform_grid( grid, (flip_rows, flip_cols, False) )
+
+
+def canonical( spec ):
+    # Canonical text of the puzzle (the least of its equivalent forms) and
+    # the transform mapping the puzzle to it
+    return min( ( spec_text( transform_spec( spec, t ) ), t ) for t in transforms( spec ) )
+
+
+class SolutionCache:
+    """Solutions of puzzles in an SQLite file, shared by puzzles equal up to
+    transposition and mirror images.
+
+    Solutions are grids of color codes (as from nono.nono_solution_grid),
+    stored in the orientation of the canonical puzzle and handed back in
+    that of the puzzle asked for. An entry is complete if it holds every
+    solution; an incomplete one answers requests for at most as many
+    solutions as it holds."""
+
+    def __init__( self, path ):
+        self.path = path
+        self.hits, self.misses = 0, 0
+        self._db, self._pid = None, None
+
+
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        state['_db'], state['_pid'] = None, None
+        return state
+
+
+    def _connect( self ):
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect( self.path, timeout=60 )
+            self._db.execute( "PRAGMA journal_mode=WAL" )
+            self._db.execute( "CREATE TABLE IF NOT EXISTS solutions "
+                              "(key TEXT PRIMARY KEY, spec TEXT, grids TEXT, count INTEGER, complete INTEGER)" )
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+
+    @staticmethod
+    def key( text ):
+        return hashlib.sha256( text.encode() ).hexdigest()
+
+
+    def get( self, spec, max_solutions=None ):
+        """The solutions of spec, at most max_solutions of them, or None if
+        the cache cannot tell."""
+
+        text, t = canonical( spec )
+        row = self._connect().execute( "SELECT spec, grids, count, complete FROM solutions WHERE key = ?",
+                                       (self.key( text ),) ).fetchone()
+        if None == row or text != row[0] or not ( row[3] or ( None != max_solutions and row[2] >= max_solutions ) ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        grids = json.loads( row[1] )[:max_solutions]
+        return [ untransform_grid( grid, t ) for grid in grids ]
+
+
+    def put( self, spec, grids, complete ):
+        # Keep whichever of the stored and the given solutions says more
+        text, t = canonical( spec )
+        db = self._connect()
+        with placecache.alarm_blocked():
+            db.execute( "INSERT INTO solutions VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                        "grids = excluded.grids, count = excluded.count, complete = excluded.complete "
+                        "WHERE NOT solutions.complete AND (excluded.complete OR excluded.count > solutions.count)",
+                        (self.key( text ), text, json.dumps( [ transform_grid( grid, t ) for grid in grids ] ),
+                         len( grids ), int( complete )) )
+            db.commit()
+
+
+if __name__ == '__main__':
+    # A puzzle and its transposed mirror image share their entry
+    spec = { "rows": [ [ {"size": 2, "color": ""} ], [ {"size": 1, "color": ""} ] ],
+             "cols": [ [ {"size": 2, "color": ""} ], [ {"size": 1, "color": ""} ] ] }
+    cache = SolutionCache( ":memory:" )
+    cache.put( spec, [ [ [1, 1], [1, 0] ] ], True )
+    other = transform_spec( spec, (False, True, True) )
+    print( spec_text( other ), cache.get( other ) )
@@ -0,0 +1,202 @@
+# verify.py - Check stacks of candidate grids against the clues of a puzzle with NumPy
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import interference
+import nono
+import solcache
+
+
+def grid_codes( rows ):
+    # Color code grid of row strings, as from nono_grid_rows
+    return [ [ int( c ) if c.isdigit() else interference.color_code( c ) for c in row ] for row in rows ]
+
+
+def _clue_runs( blocks ):
+    # (color code, size) of the blocks of a clue
+    return [ ( interference.color_code( b['color'] ), b['size'] ) for b in blocks if b['size'] > 0 ]
+
+
+def _merged_runs( runs ):
+    # The runs of a line whose blocks of one letter color all touch:
+    # nothing keeps them apart, unlike black blocks
+    merged = []
+    for code, size in runs:
+        if merged and code == merged[-1][0] and 1 != code:
+            merged[-1] = ( code, merged[-1][1] + size )
+        else:
+            merged.append( ( code, size ) )
+    return merged
+
+
+def _line_runs( lines ):
+    # Run-length encoding of every line (a row of the 2D array): the line,
+    # color and length of each maximal run of one color, in order, and the
+    # number of runs per line
+    zeros = np.zeros( ( lines.shape[0], 1 ), dtype=lines.dtype )
+    prev  = np.concatenate( ( zeros, lines[:, :-1] ), axis=1 )
+    nxt   = np.concatenate( ( lines[:, 1:], zeros ), axis=1 )
+    filled = lines != 0
+    line, start = np.nonzero( filled & ( lines != prev ) )
+    _, end = np.nonzero( filled & ( lines != nxt ) )
+    return line, lines[line, start], end - start + 1, np.bincount( line, minlength=lines.shape[0] )
+
+
+def _fits( runs, clue ):
+    # Exact check of one line given as its runs: every run must be made of
+    # whole consecutive blocks of its color, several only for letter colors
+    i = 0
+    for color, size in runs:
+        total = 0
+        while total < size and i < len( clue ) and clue[i][0] == color and ( 0 == total or 1 != color ):
+            total += clue[i][1]
+            i += 1
+        if total != size:
+            return False
+    return i == len( clue )
+
+
+def _differ( encoding, expected ):
+    # (lines of all grids) mask of the lines whose runs are not the
+    # expected runs of their line
+    line, color, length, count, first = encoding
+    nlines = len( expected )
+    width = max( [ len( runs ) for runs in expected ] + [ 1 ] )
+    want_color  = np.zeros( ( nlines, width ), dtype=np.int64 )
+    want_length = np.zeros( ( nlines, width ), dtype=np.int64 )
+    for lid, runs in enumerate( expected ):
+        for k, ( code, size ) in enumerate( runs ):
+            want_color[lid, k], want_length[lid, k] = code, size
+    # Runs by their rank within the line; those beyond the widest clue
+    # already fail on the count
+    rank = np.arange( len( line ) ) - first[line]
+    keep = rank < width
+    got_color  = np.zeros( ( len( count ), width ), dtype=np.int64 )
+    got_length = np.zeros( ( len( count ), width ), dtype=np.int64 )
+    got_color[line[keep], rank[keep]]  = color[keep]
+    got_length[line[keep], rank[keep]] = length[keep]
+    ngrids = len( count ) // nlines
+    return ( count.reshape( ngrids, nlines ) != [ len( runs ) for runs in expected ] ) | \
+           ( got_color.reshape( ngrids, nlines, width ) != want_color ).any( axis=2 ) | \
+           ( got_length.reshape( ngrids, nlines, width ) != want_length ).any( axis=2 )
+
+
+def _mismatches( lines, clues ):
+    # (grids, lines) mask of the lines not matching their clue, for lines
+    # of shape (grids, lines, cells). A line matches when its runs are the
+    # blocks of its clue, or these blocks with those of one letter color
+    # merged; lines with only some of them merged are checked one by one.
+    ngrids, nlines, ncells = lines.shape
+    line, color, length, count = _line_runs( lines.reshape( ngrids * nlines, ncells ) )
+    encoding = ( line, color, length, count, np.cumsum( count ) - count )
+    expected = [ _clue_runs( blocks ) for blocks in clues ]
+    merged   = [ _merged_runs( runs ) for runs in expected ]
+    bad = _differ( encoding, expected )
+    if merged != expected:
+        bad &= _differ( encoding, merged )
+        first = encoding[4]
+        for g, lid in zip( *np.nonzero( bad ) ):
+            if merged[lid] != expected[lid]:
+                f = g * nlines + lid
+                mine = slice( first[f], first[f] + count[f] )
+                bad[g, lid] = not _fits( zip( color[mine].tolist(), length[mine].tolist() ), expected[lid] )
+    # A black block needs a gap before the next block
+    return bad | ( ( lines[:, :, :-1] == 1 ) & ( lines[:, :, 1:] > 1 ) ).any( axis=2 )
+
+
+def verify_grids( spec, grids ):
+    """Check candidate grids (N x rows x cols color codes, see
+    interference.color_code) against the clues of spec, as from nono_read.
+    Returns two arrays of N: whether each grid solves the puzzle, and the
+    first line it breaks (rows first, then columns: row i is line i,
+    column j line rows+j), -1 when none. No grids at all, as cached for an
+    unsolvable puzzle, give empty arrays."""
+
+    grids = np.asarray( grids, dtype=np.int64 )
+    nrows, ncols = len( spec['rows'] ), len( spec['cols'] )
+    # An empty list has shape (0,), not (0, rows, cols)
+    if grids.shape[:1] == ( 0, ):
+        return np.ones( 0, dtype=bool ), np.zeros( 0, dtype=np.int64 )
+    if 3 != grids.ndim or grids.shape[1:] != ( nrows, ncols ):
+        raise ValueError( "Expected grids of shape (N, {}, {}), got {}".format( nrows, ncols, grids.shape ) )
+    bad = np.concatenate( ( _mismatches( grids, spec['rows'] ),
+                            _mismatches( grids.transpose( 0, 2, 1 ), spec['cols'] ) ), axis=1 )
+    ok = ~bad.any( axis=1 )
+    return ok, np.where( ok, -1, bad.argmax( axis=1 ) )
+
+
+def verify_line_name( spec, line ):
+    nrows = len( spec['rows'] )
+    return "row {}".format( line ) if line < nrows else "column {}".format( line - nrows )
+
+
+def verify_solutions( path ):
+    # Check every entry of a solcache.SolutionCache file. Yields (spec text,
+    # grids, ok, first) per entry.
+    cache = solcache.SolutionCache( path )
+    for text, grids in cache._connect().execute( "SELECT spec, grids FROM solutions" ):
+        grids = json.loads( grids )
+        yield ( text, grids ) + verify_grids( nono.nono_loads( text ), grids )
+
+
+def verify_results( path ):
+    # Check the grids of batch results (JSON Lines) against their puzzle
+    # files. Yields (puzzle, ok, first line) per result with a grid.
+    with open( path, 'r' ) as file:
+        for line in file:
+            result = json.loads( line )
+            if "grid" not in result or not os.path.isfile( result["puzzle"] ):
+                continue
+            spec = nono.nono_read( result["puzzle"] )
+            ok, first = verify_grids( spec, [ grid_codes( result["grid"] ) ] )
+            yield result["puzzle"], spec, bool( ok[0] ), int( first[0] )
+
+
+def verify_self_check():
+    # Known answers: the solution of a bundled puzzle passes and fails with
+    # a row changed, and a cache holding it and an unsolvable puzzle (no
+    # grids) is checked entry by entry
+    here = os.path.dirname( os.path.abspath( __file__ ) )
+    spec = nono.nono_read( os.path.join( here, "zazhim.txt" ) )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join( directory, "solutions.sqlite" )
+        cache = solcache.SolutionCache( path )
+        grids, _ = nono.nono_cached_solve( spec, cache )
+        cache.put( nono.nono_loads( "2/2|1/1" ), [], True )
+        entries = sorted( ( len( grids ), ok.tolist(), first.tolist() ) for _, grids, ok, first in verify_solutions( path ) )
+        assert entries == [ ( 0, [], [] ), ( 1, [ True ], [ -1 ] ) ], entries
+    broken = np.array( grids )
+    broken[0, 0, :] = 1 - np.minimum( broken[0, 0, :], 1 )
+    ok, first = verify_grids( spec, np.concatenate( ( grids, broken ) ) )
+    assert ok.tolist() == [ True, False ] and first.tolist() == [ -1, 0 ], ( ok, first )
+    print( "self-check passed" )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check solved grids against the clues of their puzzles.")
+    parser.add_argument("--solutions", default=None, help="Check every entry of a solution cache (SQLite file)")
+    parser.add_argument("--results", default=None, help="Check the grids of batch results (JSON Lines file)")
+    parser.add_argument("--self-check", action="store_true", help="Check the verifier itself on known answers")
+    args = parser.parse_args()
+    #
+    if args.self_check:
+        verify_self_check()
+    entries, checked, failed = 0, 0, 0
+    if args.solutions:
+        for text, grids, ok, first in verify_solutions( args.solutions ):
+            spec = nono.nono_loads( text )
+            for index in np.flatnonzero( ~ok ):
+                print( "{} solution {}: wrong {}".format( text, index, verify_line_name( spec, first[index] ) ) )
+            entries, checked, failed = entries + 1, checked + len( ok ), failed + int( ( ~ok ).sum() )
+    if args.results:
+        for puzzle, spec, ok, first in verify_results( args.results ):
+            if not ok:
+                print( "{}: wrong {}".format( puzzle, verify_line_name( spec, first ) ) )
+            entries, checked, failed = entries + 1, checked + 1, failed + ( not ok )
+    print( "{} puzzles, {} grids checked, {} wrong".format( entries, checked, failed ) )
+    sys.exit( 1 if failed else 0 )